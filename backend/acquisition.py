@@ -0,0 +1,134 @@
+"""
+Resident acquisition service which keeps the serial ports open and
+polls all active meters every quarter-hour on its own.
+"""
+import logging
+import queue
+import threading
+from contextlib import ExitStack
+from datetime import datetime
+from django.db import connection
+from backend.eastronSDM630 import EastronSDM630
+from backend.journal import JOURNAL
+from backend.plan import get_plan
+from backend.sampling import PowerSampler
+from backend.serial import Cycle, next_quarter_hour, poll_meters
+from backend.topology import PORTS_LIST
+
+logger = logging.getLogger(__name__)
+
+
+class AcquisitionService:
+    """Polls all active meters at every quarter-hour without leaving the process.
+
+    One EastronSDM630 instrument is kept per port and slave address, so the
+    serial handles stay open between cycles. The ports of the meters are
+    taken from the cached topology. Finished cycles are handed to a writer
+    thread which saves their readings in batches.
+
+    Optionally, the instantaneous power of all meters is sampled in between
+    the quarter-hours by a PowerSampler.
+
+    Attributes:
+        ports (list): The serial port names which will be probed for meters.
+        batch_size (int): The maximum number of MeterData objects per INSERT.
+        sample_interval (float): Seconds between two power samples of a meter,
+            None disables sampling.
+    """
+    def __init__(self, ports=None, batch_size=500, sample_interval=None):
+        self.ports = PORTS_LIST if ports is None else ports
+        self.batch_size = batch_size
+        self.sample_interval = sample_interval
+        self.instruments = dict()
+        self.bus_locks = dict()
+        self.cycles = queue.Queue()
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def get_instrument(self, port, address):
+        """Returns the cached instrument for a slave address on a port.
+
+        New instruments are created with the baud rate of the bus, since all
+        instruments on a port share one serial connection.
+        """
+        baudrate = get_plan().get_baudrate(port)
+        with self._lock:
+            key = (port, address)
+            if key not in self.instruments:
+                self.instruments[key] = EastronSDM630(port, address, baudrate)
+            return self.instruments[key]
+
+    def bus_lock(self, port):
+        """Returns the lock which has to be held while talking to the meters on a port."""
+        with self._lock:
+            if port not in self.bus_locks:
+                self.bus_locks[port] = threading.Lock()
+            return self.bus_locks[port]
+
+    def run_cycle(self, query_time):
+        """Polls every bus in its own thread and queues the readings for the writer.
+        A failing cycle is logged, so that the service keeps running, and what it
+        has read so far is saved anyway.
+
+        Returns:
+            A string containing all queried meter ID's.
+        """
+        cycle = Cycle(query_time)
+        try:
+            with ExitStack() as stack:
+                # Keep the sampler off the buses while polling.
+                for port in self.ports:
+                    stack.enter_context(self.bus_lock(port))
+                diagnose_str = poll_meters(cycle, self.ports, self.get_instrument)
+        except Exception:
+            logger.exception('%s: The polling cycle of %s failed' % (datetime.today(), query_time))
+            diagnose_str = 'The polling cycle failed after %d readings.' % len(cycle.readings)
+        self.cycles.put(cycle)
+        return diagnose_str
+
+    def write_readings(self):
+        """Saves queued cycles until the service is stopped and the queue is drained.
+        In between, readings left in the journal by a failed save are replayed once a minute."""
+        last_replay = datetime.today()
+        try:
+            while not (self.stopped.is_set() and self.cycles.empty()):
+                try:
+                    cycle = self.cycles.get(timeout=1)
+                except queue.Empty:
+                    if (datetime.today() - last_replay).total_seconds() >= 60:
+                        last_replay = datetime.today()
+                        try:
+                            JOURNAL.replay(self.batch_size)
+                        except Exception:
+                            logger.exception('%s: Could not replay the journal' % datetime.today())
+                    continue
+
+                try:
+                    cycle.save(batch_size=self.batch_size)
+                except Exception:
+                    logger.exception('%s: Could not save %d readings, they are kept in the journal'
+                                     % (datetime.today(), len(cycle.readings)))
+        finally:
+            connection.close()
+
+    def run(self):
+        """Runs the quarter-hour schedule until ``stop`` is called."""
+        writer = threading.Thread(target=self.write_readings, name='mmetering-writer')
+        writer.start()
+        if self.sample_interval:
+            sampler = PowerSampler(self, self.sample_interval)
+            threading.Thread(target=sampler.run, name='mmetering-sampler', daemon=True).start()
+
+        try:
+            while not self.stopped.is_set():
+                query_time = next_quarter_hour(datetime.today())
+                if self.stopped.wait((query_time - datetime.today()).total_seconds()):
+                    break
+
+                logger.debug(self.run_cycle(query_time))
+        finally:
+            self.stopped.set()
+            writer.join()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,317 @@
+"""
+Asyncio driver for the Eastron SDM630 metering device, for communication via the Modbus RTU protocol.
+
+Offers the same reads as :py:class:`backend.eastronSDM630.EastronSDM630`, but runs over an
+asynchronous serial transport (*pyserial-asyncio*), so that many buses can be polled
+concurrently from one event loop instead of one thread per port.
+"""
+import asyncio
+import logging
+import struct
+from time import perf_counter
+from serial.serialutil import SerialException
+from backend.eastronSDM630 import (
+    FUNC_CODE_HOLDING_REG, FUNC_CODE_INPUT_REG, MAX_REGISTERS_PER_REQUEST, DEFAULT_BAUDRATE,
+    CHARACTER_BITS, RESPONSE_TIME, REG_SDMTotalImport, REG_SDMTotalExport, REG_SDML1Import,
+    REG_SDML2Import, REG_SDML3Import, REG_SDML1Export, REG_SDML2Export, REG_SDML3Export,
+    REG_SDMNetworkBaudRate, REG_SDML1Voltage, REG_SDML1THDVoltageNeutral, REQUEST_LENGTH,
+    QUALITY_BLOCK_FLOATS, THD_BLOCK_FLOATS, crc16, power_quality_values
+)
+from backend.serial import BusPoll, create_meter_data
+from backend.topology import get_baudrate
+from mmetering.models import PowerQualityData
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+
+def build_request(slaveaddress, functioncode, registeraddress, count):
+    """Builds a read request for ``count`` registers starting at ``registeraddress``."""
+    frame = struct.pack('>BBHH', slaveaddress, functioncode, registeraddress, count)
+    return frame + crc16(frame)
+
+
+def parse_response(response, slaveaddress, functioncode, count):
+    """Checks a response frame and extracts the register data.
+
+    Returns:
+        The payload as bytes, two bytes per register.
+
+    Raises:
+        IOError
+    """
+    if crc16(response[:-2]) != response[-2:]:
+        raise IOError('Wrong CRC in the response of slave %d' % slaveaddress)
+    if response[0] != slaveaddress:
+        raise IOError('Response from slave %d instead of %d' % (response[0], slaveaddress))
+    if response[1] == functioncode | 0x80:
+        raise IOError('Slave %d answered with exception code %d' % (slaveaddress, response[2]))
+    if response[1] != functioncode or response[2] != 2 * count:
+        raise IOError('Malformed response from slave %d' % slaveaddress)
+
+    return response[3:-2]
+
+
+class NoAnswerError(IOError):
+    """The slave did not answer before the timeout."""
+
+
+class AsyncBus:
+    """An asynchronous serial connection to one RS485 bus.
+
+    Only one request is on the bus at any time. Every request waits for the
+    Modbus RTU silent interval and for the response (or its timeout) before
+    the next one is sent.
+
+    Args:
+        portname (str): port name
+        baudrate (int): baud rate of the port, defaults to 19200
+    """
+    def __init__(self, portname, baudrate=DEFAULT_BAUDRATE):
+        self.portname = portname
+        self.baudrate = baudrate
+        self.silent_interval = max(3.5 * CHARACTER_BITS / baudrate, 0.00175)  # sec
+        self.timeout = RESPONSE_TIME + (5 + 2 * MAX_REGISTERS_PER_REQUEST) * CHARACTER_BITS / baudrate  # sec
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    async def open(self):
+        """Opens the port.
+
+        Raises:
+            ImportError, serial.serialutil.SerialException
+        """
+        if serial_asyncio is None:
+            raise ImportError('The asyncio engine requires the pyserial-asyncio package.')
+
+        self._lock = asyncio.Lock()
+        self._reader, self._writer = await serial_asyncio.open_serial_connection(
+            url=self.portname, baudrate=self.baudrate
+        )
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def request(self, slaveaddress, functioncode, registeraddress, count):
+        """Sends a read request and waits for the response.
+
+        Returns:
+            The register data as bytes.
+
+        Raises:
+            IOError
+        """
+        async with self._lock:
+            await asyncio.sleep(self.silent_interval)
+            self._writer.write(build_request(slaveaddress, functioncode, registeraddress, count))
+
+            try:
+                response = await asyncio.wait_for(self._read_response(), self.timeout)
+            except asyncio.TimeoutError:
+                await self._discard()
+                raise NoAnswerError('No answer from slave %d on %s' % (slaveaddress, self.portname))
+            except (IOError, asyncio.IncompleteReadError):
+                await self._discard()
+                raise IOError('Broken answer from slave %d on %s' % (slaveaddress, self.portname))
+
+        return parse_response(response, slaveaddress, functioncode, count)
+
+    async def _read_response(self):
+        header = await self._reader.readexactly(3)
+        if header[1] & 0x80:
+            # Exception responses consist of the code and the CRC only.
+            return header + await self._reader.readexactly(2)
+
+        return header + await self._reader.readexactly(header[2] + 2)
+
+    async def _discard(self):
+        """Drops the remains of a late or broken response."""
+        try:
+            while await asyncio.wait_for(self._reader.read(256), 4 * self.silent_interval):
+                pass
+        except asyncio.TimeoutError:
+            pass
+
+
+class AsyncEastronSDM630:
+    """Asyncio counterpart of :py:class:`backend.eastronSDM630.EastronSDM630`.
+
+    Args:
+        bus (AsyncBus): the bus the meter is connected to
+        slaveaddress (int): slave address in the range 1 to 247
+    """
+    def __init__(self, bus, slaveaddress):
+        self.bus = bus
+        self.slaveaddress = slaveaddress
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.timeouts = 0
+
+    def counters(self):
+        """Returns a tuple (bytes sent, bytes received, timeouts) of all reads of this instrument."""
+        return self.bytes_sent, self.bytes_received, self.timeouts
+
+    async def is_reachable(self):
+        try:
+            await self.read_holding_register(REG_SDMNetworkBaudRate, 2)
+        except IOError:
+            return False
+
+        return True
+
+    async def read_holding_register(self, hexc, length):
+        return await self.read_float_register(hexc, FUNC_CODE_HOLDING_REG, length)
+
+    async def read_input_register(self, hexc, length):
+        return await self.read_float_register(hexc, FUNC_CODE_INPUT_REG, length)
+
+    async def read_float_register(self, hexc, code, length):
+        values = await self.read_float_registers(hexc, code, length // 2)
+        return values[0]
+
+    async def read_input_registers(self, hexc, count):
+        return await self.read_float_registers(hexc, FUNC_CODE_INPUT_REG, count)
+
+    async def read_float_registers(self, hexc, code, count):
+        """Reads a span of consecutive floats with a single request.
+
+        Returns:
+            A list of numerical values (float).
+
+        Raises:
+            ValueError, IOError
+        """
+        if not 1 <= 2 * count <= MAX_REGISTERS_PER_REQUEST:
+            raise ValueError('Can not read %d floats in one request, the maximum is %d.'
+                             % (count, MAX_REGISTERS_PER_REQUEST // 2))
+
+        self.bytes_sent += REQUEST_LENGTH
+        try:
+            payload = await self.bus.request(self.slaveaddress, code, int(hexc, 16), 2 * count)
+        except NoAnswerError:
+            self.timeouts += 1
+            raise
+
+        self.bytes_received += 5 + len(payload)
+        return list(struct.unpack('>%df' % count, payload))
+
+    async def read_total_import(self):
+        return await self.read_input_register(REG_SDMTotalImport, 2)
+
+    async def read_import_L1(self):
+        return await self.read_input_register(REG_SDML1Import, 2)
+
+    async def read_import_L2(self):
+        return await self.read_input_register(REG_SDML2Import, 2)
+
+    async def read_import_L3(self):
+        return await self.read_input_register(REG_SDML3Import, 2)
+
+    async def read_total_export(self):
+        return await self.read_input_register(REG_SDMTotalExport, 2)
+
+    async def read_export_L1(self):
+        return await self.read_input_register(REG_SDML1Export, 2)
+
+    async def read_export_L2(self):
+        return await self.read_input_register(REG_SDML2Export, 2)
+
+    async def read_export_L3(self):
+        return await self.read_input_register(REG_SDML3Export, 2)
+
+    async def read_import_values(self):
+        total = await self.read_total_import()
+        value_l1, value_l2, value_l3 = await self.read_input_registers(REG_SDML1Import, 3)
+        return total, value_l1, value_l2, value_l3
+
+    async def read_export_values(self):
+        total = await self.read_total_export()
+        value_l1, value_l2, value_l3 = await self.read_input_registers(REG_SDML1Export, 3)
+        return total, value_l1, value_l2, value_l3
+
+    async def read_power_quality_values(self):
+        block = await self.read_input_registers(REG_SDML1Voltage, QUALITY_BLOCK_FLOATS)
+        thd = await self.read_input_registers(REG_SDML1THDVoltageNeutral, THD_BLOCK_FLOATS)
+        return power_quality_values(block, thd)
+
+    async def read_network_baud_rate(self):
+        return await self.read_holding_register(REG_SDMNetworkBaudRate, 2)
+
+
+async def request_meter_data(meter, eastron, cycle):
+    try:
+        if meter.flat.modus == 'IM':
+            values = await eastron.read_import_values()
+        else:
+            values = await eastron.read_export_values()
+    except IOError:
+        return False
+
+    cycle.add_reading(create_meter_data(meter, cycle.query_time, values))
+    if cycle.quality is not None:
+        try:
+            cycle.quality.append(PowerQualityData(meter_id=meter.pk, saved_time=cycle.query_time,
+                                                  **await eastron.read_power_quality_values()))
+        except IOError:
+            logger.info('Could not read the power quality of meter with address %d' % meter.addresse)
+
+    return True
+
+
+async def poll_bus(poll, bus):
+    """Works through the scheduled reads of one bus."""
+    try:
+        await bus.open()
+    except (SerialException, OSError):
+        for meter in poll.reads.pending():
+            poll.port_unavailable(meter)
+        poll.reads.clear()
+        return
+
+    try:
+        async for meter, attempt in poll.reads:
+            eastron = AsyncEastronSDM630(bus, meter.addresse)
+            started = perf_counter()
+            success = await request_meter_data(meter, eastron, poll.cycle)
+            poll.stats.record(meter, success, perf_counter() - started, (0, 0, 0), eastron.counters())
+            poll.done(meter, attempt, success)
+    finally:
+        bus.close()
+
+
+def poll_buses(buses, cycle, baudrates=None):
+    """Polls all buses concurrently from one event loop.
+
+    Args:
+        buses: A dictionary mapping each port to its meters.
+        cycle: The Cycle collecting the readings and meter changes.
+        baudrates: A dictionary mapping ports to their baud rates, queried
+            from the database if not given.
+
+    Returns:
+        A string containing all queried meter ID's.
+    """
+    polls = [BusPoll(port, meters, cycle) for port, meters in buses.items()]
+    if baudrates is None:
+        baudrates = {port: get_baudrate(port) for port in buses}
+    tasks = [poll_bus(poll, AsyncBus(poll.port, baudrates.get(poll.port, DEFAULT_BAUDRATE))) for poll in polls]
+
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(asyncio.gather(*tasks))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    for poll in polls:
+        poll.finish()
+
+    return ''.join(poll.report() for poll in polls)
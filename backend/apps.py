@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save, post_delete
 
 
 class BackendConfig(AppConfig):
     name = 'backend'
     verbose_name = 'Backend Application'
+
+    def ready(self):
+        from backend.models import Bus
+        from backend.plan import invalidate_plan
+        from mmetering.models import Flat, Meter
+
+        # The cached ports are kept up to date by the cycles, see AcquisitionPlan.update_ports.
+        for model in (Meter, Flat, Bus):
+            post_save.connect(invalidate_plan, sender=model, dispatch_uid='invalidate_plan_%s' % model.__name__)
+            post_delete.connect(invalidate_plan, sender=model, dispatch_uid='invalidate_plan_%s' % model.__name__)
@@ -0,0 +1,97 @@
+"""
+Throughput benchmark of the acquisition path against simulated buses of SDM630 meters.
+"""
+import os
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+from backend.journal import Journal
+from backend.serial import Cycle, DEADLINE_MARGIN, CYCLE_MINUTES, poll_meters
+from backend.simulator import SimulatedBus
+from backend.topology import save_ports, set_baudrate
+from mmetering.models import Flat, Meter
+
+MAX_ADDRESS = 247
+
+
+def create_meters(count, buses):
+    """Creates ``count`` active meters, every tenth one as export meter. The meters
+    are numbered per bus, the i-th meter belongs to bus ``i % buses``.
+
+    Returns:
+        A list of Meter objects.
+    """
+    Flat.objects.bulk_create(
+        Flat(name='Benchmark %d' % i, modus='EX' if i % 10 == 0 else 'IM') for i in range(count)
+    )
+    flats = Flat.objects.filter(name__startswith='Benchmark ').order_by('pk')
+    Meter.objects.bulk_create(
+        Meter(flat=flat, addresse=i // buses + 1, seriennummer='BENCH%d' % i,
+              active=True, start_datetime=datetime(2017, 1, 1))
+        for i, flat in enumerate(flats)
+    )
+    return list(Meter.objects.filter(flat__in=flats).select_related('flat').order_by('pk'))
+
+
+def run_benchmark(meters=200, buses=1, cycles=3, latency=0.01, error_rate=0.0, baudrate=19200, engine='serial'):
+    """Polls simulated meters like the save_meter_data_task does and measures each cycle.
+
+    The meters are spread evenly over the buses, each bus takes at most 247 meters.
+    Creates Flat and Meter objects, so it has to run against a test database.
+    The readings go through a temporary journal, so that readings pending in the
+    journal of the acquisition are not replayed into the test database.
+
+    Returns:
+        A list of dictionaries, one per cycle, with the keys
+        ``duration`` (sec), ``save_duration`` (sec), ``readings``, ``meters_per_second``,
+        ``retries`` and ``requests`` (number of frames sent on all buses).
+    """
+    if meters > buses * MAX_ADDRESS:
+        raise ValueError('Can not simulate more than %d meters on %d buses.' % (buses * MAX_ADDRESS, buses))
+
+    all_meters = create_meters(meters, buses)
+    per_bus = [all_meters[i::buses] for i in range(buses)]
+    simulated = [SimulatedBus([meter.addresse for meter in bus_meters], latency, error_rate, baudrate)
+                 for bus_meters in per_bus]
+
+    results = []
+    directory = tempfile.TemporaryDirectory()
+    journal = Journal(os.path.join(directory.name, 'benchmark.journal'))
+    for bus in simulated:
+        bus.start()
+
+    try:
+        ports = [bus.port for bus in simulated]
+        for port, bus_meters in zip(ports, per_bus):
+            set_baudrate(port, baudrate)
+            save_ports(port, bus_meters)
+
+        start_time = datetime.today().replace(second=0, microsecond=0)
+        for i in range(cycles):
+            cycle = Cycle(start_time + timedelta(minutes=CYCLE_MINUTES * i), journal=journal)
+            # Give every cycle a full quarter-hour, regardless of the current time.
+            cycle.deadline = datetime.today() + timedelta(minutes=CYCLE_MINUTES) - DEADLINE_MARGIN
+            requests = sum(bus.requests for bus in simulated)
+
+            started = perf_counter()
+            poll_meters(cycle, ports, engine=engine)
+            duration = perf_counter() - started
+
+            started = perf_counter()
+            cycle.save()
+            save_duration = perf_counter() - started
+
+            results.append({
+                'duration': duration,
+                'save_duration': save_duration,
+                'readings': len(cycle.readings),
+                'meters_per_second': len(cycle.readings) / duration,
+                'retries': len(cycle.retried),
+                'requests': sum(bus.requests for bus in simulated) - requests,
+            })
+    finally:
+        for bus in simulated:
+            bus.stop()
+        directory.cleanup()
+
+    return results
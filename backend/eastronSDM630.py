@@ -3,6 +3,7 @@ Driver for the Eastron SDM630 metering device, for communication via the Modbus
 """
 
 import minimalmodbus
+import struct
 from time import sleep
 import logging
 
@@ -39,6 +40,64 @@ REG_SDML3THDVoltageNeutral = '0x00ee'
 REG_SDMAvgTHDVoltageNeutral = '0x00F8'
 REG_SDMFrequency = '0x0046'
 
+REG_SDMNetworkBaudRate = '0x001C'
+# Unsigned 32 bit integer in two holding registers.
+REG_SDMSerialNumber = '0xFC00'
+
+# The SDM630 answers at most 80 registers (40 floats) per request.
+MAX_REGISTERS_PER_REQUEST = 80
+# Slave address, function code, register address, register count and CRC.
+REQUEST_LENGTH = 8  # bytes
+
+# Power quality quantities, read with two block requests: voltage, current,
+# power and frequency lie within the first 36 floats, the voltage THD of each
+# phase within the 8 floats starting at REG_SDML1THDVoltageNeutral.
+QUALITY_BLOCK_FLOATS = (int(REG_SDMFrequency, 16) - int(REG_SDML1Voltage, 16)) // 2 + 1
+THD_BLOCK_FLOATS = (int(REG_SDMAvgTHDVoltageNeutral, 16) - int(REG_SDML1THDVoltageNeutral, 16)) // 2 + 1
+
+# Baud rates as encoded in the Network Baud Rate register.
+BAUDRATES = {0: 2400, 1: 4800, 2: 9600, 3: 19200, 4: 38400}
+DEFAULT_BAUDRATE = 19200
+# Start bit, 8 data bits, parity or second stop bit, stop bit.
+CHARACTER_BITS = 11
+# Time the meter takes before it starts to answer a request.
+RESPONSE_TIME = 0.2  # sec
+
+
+def crc16(data):
+    """Calculates the Modbus CRC of a frame.
+
+    Returns:
+        The two CRC bytes, least significant byte first.
+    """
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for i in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+
+    return struct.pack('<H', crc)
+
+
+def power_quality_values(block, thd):
+    """Picks the power quality quantities from the floats of the two block requests.
+
+    Returns:
+        A dictionary with the keys voltage_l1 to voltage_l3 (V), current_l1 to
+        current_l3 (A), power_l1 to power_l3 (W), thd_l1 to thd_l3 (%) and frequency (Hz).
+    """
+    values = {'frequency': block[QUALITY_BLOCK_FLOATS - 1]}
+    for phase in range(3):
+        values['voltage_l%d' % (phase + 1)] = block[phase]
+        values['current_l%d' % (phase + 1)] = block[3 + phase]
+        values['power_l%d' % (phase + 1)] = block[6 + phase]
+        values['thd_l%d' % (phase + 1)] = thd[phase]
+
+    return values
+
 
 class EastronSDM630(minimalmodbus.Instrument):
     """Instrument class for EastronSDM630 meter.
@@ -48,6 +107,7 @@ class EastronSDM630(minimalmodbus.Instrument):
     Args:
         portname (str): port name
         slaveaddress (int): slave address in the range 1 to 247
+        baudrate (int): baud rate of the port, defaults to 19200
 
     Implemented with these function codes (in decimal):
 
@@ -56,6 +116,7 @@ class EastronSDM630(minimalmodbus.Instrument):
     =======================  ====================
     Read holding registers   3
     Read input registers     4
+    Write registers          16
     =======================  ====================
 
     Raises:
@@ -63,12 +124,32 @@ class EastronSDM630(minimalmodbus.Instrument):
 
     """
 
-    def __init__(self, portname, slaveaddress):
+    def __init__(self, portname, slaveaddress, baudrate=DEFAULT_BAUDRATE):
         self.portname = portname
         self.slaveaddress = slaveaddress
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.timeouts = 0
 
         minimalmodbus.Instrument.__init__(self, portname, slaveaddress)
-        self.serial.timeout = 0.5  # sec
+        self.set_baudrate(baudrate)
+
+    def set_baudrate(self, baudrate):
+        """Sets the baud rate of the port and derives the timing from it.
+
+        The Modbus RTU standard prescribes a silent period corresponding to 3.5 characters
+        between each message, to be able fo figure out where one message ends and the next
+        one starts. Above 19200 baud a fixed silent period of 1.75ms is recommended.
+        The timeout covers the response time of the meter plus the transmission of the
+        longest possible response.
+
+        Args:
+            baudrate (int): The baud rate in bits/s.
+        """
+        self.serial.baudrate = baudrate
+        self.silent_interval = max(3.5 * CHARACTER_BITS / baudrate, 0.00175)  # sec
+        response_length = 5 + 2 * MAX_REGISTERS_PER_REQUEST  # bytes
+        self.serial.timeout = RESPONSE_TIME + response_length * CHARACTER_BITS / baudrate  # sec
 
     def is_reachable(self):
         """Reads the register with start address 1C which holds
@@ -84,6 +165,24 @@ class EastronSDM630(minimalmodbus.Instrument):
 
         return True
 
+    def counters(self):
+        """Returns a tuple (bytes sent, bytes received, timeouts) of all reads
+        since the instrument has been created."""
+        return self.bytes_sent, self.bytes_received, self.timeouts
+
+    def _count(self, read, registers):
+        """Performs a read request and counts the bytes on the wire.
+        minimalmodbus raises an IOError if the slave does not answer."""
+        self.bytes_sent += REQUEST_LENGTH
+        try:
+            result = read()
+        except IOError:
+            self.timeouts += 1
+            raise
+
+        self.bytes_received += 5 + 2 * registers
+        return result
+
     def get_slaveaddress(self):
         return self.slaveaddress
 
@@ -119,7 +218,7 @@ class EastronSDM630(minimalmodbus.Instrument):
         The Modbus RTU standard prescribes a silent period corresponding to 3.5 characters
         between each message, to be able fo figure out where one message ends and
         the next one starts. On a baud rate of 19200 (19200 bits/s) a 3.5 characters silent
-        period corresponds to 2.0ms.
+        period corresponds to 2.0ms, see ``set_baudrate``.
 
         Args:
             hexc: The slaves register number as a hex.
@@ -132,9 +231,71 @@ class EastronSDM630(minimalmodbus.Instrument):
         Raises:
             ValueError, TypeError, IOError
         """
-        # In order to avoid overlapping messages, wait 2ms as described above.
-        sleep(0.002)
-        return self.read_float(int(hexc, 16), functioncode=code, numberOfRegisters=length)
+        # In order to avoid overlapping messages, wait as described above.
+        sleep(self.silent_interval)
+        return self._count(lambda: self.read_float(int(hexc, 16), functioncode=code, numberOfRegisters=length),
+                           length)
+
+    def read_input_registers(self, hexc, count):
+        """Reads consecutive MODBUS input registers holding floats.
+
+        Args:
+            hexc: The slaves register number of the first float.
+            count: The number of floats to read.
+
+        Returns:
+            A list of numerical values.
+        """
+        return self.read_float_registers(hexc, 4, count)
+
+    def read_float_registers(self, hexc, code, count):
+        """Read a span of consecutive floating point numbers from the slave
+        with a single request and decode all of them from the response buffer.
+        Each float is allocated to two registers, so a span of ``count`` floats
+        starting at ``hexc`` covers the registers ``hexc`` to ``hexc + 2 * count - 1``.
+
+        Args:
+            hexc: The slaves register number of the first float as a hex.
+            code: The MODBUS function code.
+            count: The number of floats to read.
+
+        Returns:
+            A list of numerical values (float).
+
+        Raises:
+            ValueError, TypeError, IOError
+        """
+        if not 1 <= 2 * count <= MAX_REGISTERS_PER_REQUEST:
+            raise ValueError('Can not read %d floats in one request, the maximum is %d.'
+                             % (count, MAX_REGISTERS_PER_REQUEST // 2))
+
+        sleep(self.silent_interval)
+        registers = self._count(lambda: self.read_registers(int(hexc, 16), 2 * count, functioncode=code),
+                                2 * count)
+        return [struct.unpack('>f', struct.pack('>HH', registers[i], registers[i + 1]))[0]
+                for i in range(0, len(registers), 2)]
+
+    def read_import_values(self):
+        """Reads the total import and the import of each phase with two requests,
+        one for the total and one for the contiguous L1 to L3 registers.
+
+        Returns:
+            A tuple (total, L1, L2, L3) of numerical values.
+        """
+        total = self.read_total_import()
+        value_l1, value_l2, value_l3 = self.read_input_registers(REG_SDML1Import, 3)
+        return total, value_l1, value_l2, value_l3
+
+    def read_export_values(self):
+        """Reads the total export and the export of each phase with two requests,
+        one for the total and one for the contiguous L1 to L3 registers.
+
+        Returns:
+            A tuple (total, L1, L2, L3) of numerical values.
+        """
+        total = self.read_total_export()
+        value_l1, value_l2, value_l3 = self.read_input_registers(REG_SDML1Export, 3)
+        return total, value_l1, value_l2, value_l3
 
     def read_total_import(self):
         """Reads the Import Wh since last reset.
@@ -170,6 +331,39 @@ class EastronSDM630(minimalmodbus.Instrument):
     def read_export_L3(self):
         return self.read_input_register(REG_SDML3Export, 2)
 
+    def read_power_values(self):
+        """Reads the instantaneous power of each phase with one request.
+
+        Returns:
+            A tuple (L1, L2, L3) of numerical values in W.
+        """
+        return tuple(self.read_input_registers(REG_SDML1Power, 3))
+
+    def read_power_quality_values(self):
+        """Reads voltage, current, power, voltage THD of each phase and the frequency
+        with two block requests.
+
+        Returns:
+            A dictionary of numerical values, see ``power_quality_values``.
+        """
+        block = self.read_input_registers(REG_SDML1Voltage, QUALITY_BLOCK_FLOATS)
+        thd = self.read_input_registers(REG_SDML1THDVoltageNeutral, THD_BLOCK_FLOATS)
+        return power_quality_values(block, thd)
+
+    def read_serial_number(self):
+        """Reads the serial number printed on the meter.
+
+        Returns:
+            The serial number (int).
+
+        Raises:
+            ValueError, TypeError, IOError
+        """
+        sleep(self.silent_interval)
+        high, low = self._count(lambda: self.read_registers(int(REG_SDMSerialNumber, 16), 2,
+                                                            functioncode=FUNC_CODE_HOLDING_REG), 2)
+        return high << 16 | low
+
     def read_network_baud_rate(self):
         """Reads the network port baud rate for MODBUS Protocol, where:
 
@@ -182,7 +376,24 @@ class EastronSDM630(minimalmodbus.Instrument):
         Returns:
              The numerical value as a float.
         """
-        return self.read_holding_register('0x1C', 2)
+        return self.read_holding_register(REG_SDMNetworkBaudRate, 2)
+
+    def write_network_baud_rate(self, baudrate):
+        """Writes the network port baud rate for MODBUS Protocol.
+        The meter keeps using the old baud rate until it has been restarted.
+
+        Args:
+            baudrate (int): One of the baud rates in ``BAUDRATES``.
+
+        Raises:
+            ValueError, TypeError, IOError
+        """
+        codes = {value: code for code, value in BAUDRATES.items()}
+        if baudrate not in codes:
+            raise ValueError('The SDM630 does not support %d baud.' % baudrate)
+
+        sleep(self.silent_interval)
+        self.write_float(int(REG_SDMNetworkBaudRate, 16), codes[baudrate], numberOfRegisters=2)
 
     def __str__(self, *args, **kwargs):
         diagnose_string = 'EastronSDM630(%s, %d)\n\n' % (self.portname, self.slaveaddress)
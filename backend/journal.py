@@ -0,0 +1,200 @@
+"""
+Local write-ahead journal for readings.
+
+Every reading is appended to an append-only file of fixed-size records as
+soon as it has been read, before anything is written to the database. The
+journal is then replayed into MeterData in batches, so readings survive an
+unavailable or slow database and are inserted as soon as it is back.
+
+The file starts with a header holding the number of records written and
+replayed so far, followed by the records::
+
+    meter_id (uint32), saved_time (int64, POSIX), value, value_l1, value_l2,
+    value_l3 (float64), CRC32 of the preceding fields (uint32)
+
+It is memory-mapped and locked with ``flock`` for every access, so the
+Celery worker and the acquisition service can share it.
+"""
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from django.db import transaction
+from mmetering.deltas import recompute_deltas, set_deltas
+from mmetering.latest import update_latest
+from mmetering.models import MeterData
+from mmetering.rollups import update_rollups
+from mmetering.slots import set_slots
+from mmetering_server.settings.defaults import ACQUISITION_JOURNAL
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MMJRNL01'
+HEADER = struct.Struct('<8sQQ')  # magic, records written, records replayed
+FIELDS = struct.Struct('<Iq4d')
+CHECKSUM = struct.Struct('<I')
+RECORD_SIZE = FIELDS.size + CHECKSUM.size  # bytes
+GROW_RECORDS = 4096  # records the file grows by when it is full
+
+
+def pack_reading(meter_data):
+    fields = FIELDS.pack(meter_data.meter_id, int(meter_data.saved_time.timestamp()), meter_data.value,
+                         meter_data.value_l1, meter_data.value_l2, meter_data.value_l3)
+    return fields + CHECKSUM.pack(zlib.crc32(fields))
+
+
+def unpack_reading(record):
+    """Returns an unsaved MeterData object, or None if the record is corrupt."""
+    fields = record[:FIELDS.size]
+    if CHECKSUM.unpack(record[FIELDS.size:])[0] != zlib.crc32(fields):
+        return None
+
+    meter_id, timestamp, value, value_l1, value_l2, value_l3 = FIELDS.unpack(fields)
+    return MeterData(meter_id=meter_id, saved_time=datetime.fromtimestamp(timestamp), value=value,
+                     value_l1=value_l1, value_l2=value_l2, value_l3=value_l3)
+
+
+class Journal:
+    """An append-only journal of readings which have not been replayed into the database yet.
+
+    Args:
+        path (str): The path of the journal file, created if it does not exist.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _map(self, reserve=0):
+        """Maps the journal file while holding an exclusive lock on it.
+
+        Args:
+            reserve: The number of records to make room for.
+
+        Raises:
+            IOError
+        """
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o640)
+            try:
+                # Released when the file is closed.
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                size = os.fstat(fd).st_size
+                if size < HEADER.size:
+                    os.pwrite(fd, HEADER.pack(MAGIC, 0, 0), 0)
+                    size = HEADER.size
+
+                magic, written, replayed = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+                if magic != MAGIC:
+                    raise IOError('%s is not a readings journal' % self.path)
+
+                needed = HEADER.size + (written + reserve) * RECORD_SIZE
+                if needed > size:
+                    os.ftruncate(fd, needed + GROW_RECORDS * RECORD_SIZE)
+
+                mapped = mmap.mmap(fd, 0)
+                try:
+                    yield mapped
+                    mapped.flush()
+                finally:
+                    mapped.close()
+            finally:
+                os.close(fd)
+
+    def append(self, readings):
+        """Appends MeterData objects to the journal.
+
+        The records are flushed before the header counts them, so a crash
+        while appending never leaves partial records in the journal.
+        """
+        if not readings:
+            return
+
+        with self._map(len(readings)) as mapped:
+            magic, written, replayed = HEADER.unpack_from(mapped)
+            offset = HEADER.size + written * RECORD_SIZE
+            mapped[offset:offset + len(readings) * RECORD_SIZE] = b''.join(map(pack_reading, readings))
+            mapped.flush()
+            HEADER.pack_into(mapped, 0, MAGIC, written + len(readings), replayed)
+
+    def pending(self):
+        """Returns the number of readings which have not been replayed yet."""
+        if not os.path.exists(self.path):
+            return 0
+
+        with self._map() as mapped:
+            magic, written, replayed = HEADER.unpack_from(mapped)
+            return written - replayed
+
+    def replay(self, batch_size=None):
+        """Inserts all pending readings into MeterData, ``batch_size`` readings per transaction.
+
+        Every batch is marked as replayed right after its transaction. Readings which
+        are already in the database are skipped, so replaying a batch again after a
+        crash does not duplicate them. Once everything is replayed, the journal
+        starts from the beginning of the file again.
+
+        Returns:
+            The number of inserted readings.
+        """
+        batch_size = batch_size or 500
+        inserted = 0
+        with self._map() as mapped:
+            magic, written, replayed = HEADER.unpack_from(mapped)
+            while replayed < written:
+                end = min(replayed + batch_size, written)
+                readings = []
+                for position in range(replayed, end):
+                    offset = HEADER.size + position * RECORD_SIZE
+                    reading = unpack_reading(mapped[offset:offset + RECORD_SIZE])
+                    if reading is None:
+                        logger.error('%s: Dropping corrupt record %d of %s' % (datetime.today(), position, self.path))
+                    else:
+                        readings.append(reading)
+
+                inserted += insert_readings(readings)
+                replayed = end
+                HEADER.pack_into(mapped, 0, MAGIC, written, replayed)
+                mapped.flush()
+
+            if written:
+                HEADER.pack_into(mapped, 0, MAGIC, 0, 0)
+
+        return inserted
+
+
+def insert_readings(readings):
+    """Inserts the readings which are not in MeterData yet, judged by meter and saved_time,
+    with their consumption since the previous reading, and updates the rollups and the
+    latest reading of each meter with them.
+
+    Returns:
+        The number of inserted readings.
+    """
+    if not readings:
+        return 0
+
+    with transaction.atomic():
+        existing = set(MeterData.objects
+                       .filter(meter_id__in={reading.meter_id for reading in readings},
+                               saved_time__in={reading.saved_time for reading in readings})
+                       .values_list('meter_id', 'saved_time'))
+        new = [reading for reading in readings if (reading.meter_id, reading.saved_time) not in existing]
+        set_slots(new)
+        late, since = set_deltas(new)
+        MeterData.objects.bulk_create(new)
+        # Readings inserted out of order change the deltas of the following ones.
+        recompute_deltas(late, since)
+        update_rollups(new)
+        update_latest(new)
+
+    return len(new)
+
+
+JOURNAL = Journal(ACQUISITION_JOURNAL)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from mmetering.rollups import backfill_rollups
+from mmetering.summaries import Overview
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the hourly, daily and monthly rollups from the meter data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild the rollups from the month containing this date '
+                                            '(DD.MM.YYYY) on. Defaults to all data.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = Overview.parse_date(options['since'], False)
+            if since is None:
+                raise CommandError('Expected --since in the format DD.MM.YYYY.')
+
+        count = backfill_rollups(since)
+        self.stdout.write('Rolled up %d meter values.' % count)
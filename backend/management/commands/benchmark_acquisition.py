@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from backend.benchmark import run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Measures the throughput of the acquisition path against simulated SDM630 meters. ' \
+           'Runs in a temporary test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meters', type=int, default=200, help='Number of simulated meters.')
+        parser.add_argument('--buses', type=int, default=1, help='Number of simulated buses.')
+        parser.add_argument('--cycles', type=int, default=3, help='Number of polling cycles.')
+        parser.add_argument('--latency', type=float, default=0.01,
+                            help='Seconds a simulated meter takes before it answers.')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Probability of a request not being answered.')
+        parser.add_argument('--baudrate', type=int, default=19200, help='Simulated line speed.')
+        parser.add_argument('--engine', choices=['serial', 'asyncio'], default='serial')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = run_benchmark(options['meters'], options['buses'], options['cycles'], options['latency'],
+                                    options['error_rate'], options['baudrate'], options['engine'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write('cycle  duration [s]  save [s]  readings  meters/s  retries  requests')
+        for i, result in enumerate(results):
+            self.stdout.write('%5d  %12.3f  %8.3f  %8d  %8.1f  %7d  %8d' % (
+                i + 1, result['duration'], result['save_duration'], result['readings'],
+                result['meters_per_second'], result['retries'], result['requests']))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from mmetering.deltas import recompute_deltas
+from mmetering.models import Meter
+from mmetering.summaries import Overview
+
+
+class Command(BaseCommand):
+    help = 'Computes the consumption since the previous reading for existing meter data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only compute the deltas from this date (DD.MM.YYYY) on. '
+                                            'Defaults to all data.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = Overview.parse_date(options['since'], False)
+            if since is None:
+                raise CommandError('Expected --since in the format DD.MM.YYYY.')
+
+        updated = recompute_deltas(Meter.objects.values_list('pk', flat=True), since)
+        self.stdout.write('Updated the deltas of %d meter values.' % updated)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from mmetering.slots import backfill_slots
+
+
+class Command(BaseCommand):
+    help = 'Sets the quarter-hour slot of existing meter data.'
+
+    def handle(self, *args, **options):
+        updated = backfill_slots()
+        self.stdout.write('Set the slot of %d meter values.' % updated)
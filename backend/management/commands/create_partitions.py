@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from backend.partitions import MONTHS_AHEAD, add_partitions, setup_partitioning
+
+
+class Command(BaseCommand):
+    help = 'Creates the monthly partitions of the meter data table for the coming months (MySQL only).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=MONTHS_AHEAD,
+                            help='Number of months ahead to create partitions for.')
+        parser.add_argument('--setup', action='store_true',
+                            help='Partition the existing table first. This rewrites the whole table.')
+
+    def handle(self, *args, **options):
+        try:
+            if options['setup']:
+                created = setup_partitioning(options['months'])
+            else:
+                created = add_partitions(options['months'])
+        except (NotImplementedError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write('Created %d partition(s): %s' % (len(created), ', '.join(created)))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from mmetering.columnar import ColumnarArchive
+from mmetering.models import Meter
+
+
+class Command(BaseCommand):
+    help = 'Appends new meter data to the columnar archive used for analysis.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meter', type=int, action='append', dest='addresses',
+                            help='Address of a meter to export, can be given multiple times. Defaults to all meters.')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Write all meter data again instead of appending.')
+
+    def handle(self, *args, **options):
+        meters = Meter.objects.all()
+        if options['addresses']:
+            meters = meters.filter(addresse__in=options['addresses'])
+
+        archive = ColumnarArchive()
+        for pk, address in meters.values_list('pk', 'addresse'):
+            appended = archive.append(pk, options['rebuild'])
+            self.stdout.write('Slave %d: %d meter values appended' % (address, appended))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from mmetering.imports import CHUNK_SIZE, import_readings
+
+
+class Command(BaseCommand):
+    help = 'Imports historical readings from CSV or NDJSON files, skipping readings which already exist.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='CSV or NDJSON files, optionally gzip compressed.')
+        parser.add_argument('--format', choices=('csv', 'ndjson'),
+                            help='Format of the files, guessed from their names by default.')
+        parser.add_argument('--key', choices=('serial', 'address'), default='serial',
+                            help='Whether the meter column holds serial numbers or addresses.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Number of readings inserted at once.')
+
+    def handle(self, *args, **options):
+        stats = import_readings(options['files'], options['key'], options['format'], options['chunk_size'])
+        self.stdout.write('Imported %d readings, skipped %d existing and %d invalid rows.'
+                          % (stats['imported'], stats['skipped'], stats['invalid']))
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from backend.eastronSDM630 import EastronSDM630, BAUDRATES
+from backend.models import MeterPort
+from backend.topology import get_baudrate, set_baudrate
+
+
+class Command(BaseCommand):
+    help = 'Configures all meters on a port to use a faster baud rate. The meters apply the new baud rate ' \
+           'only after a restart, so the port settings are updated in a second run with --confirm, ' \
+           'once all meters answer at the new baud rate.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('port', help='Serial port whose meters will be configured.')
+        parser.add_argument('--baudrate', type=int, default=max(BAUDRATES.values()),
+                            choices=sorted(BAUDRATES.values()),
+                            help='The new baud rate, defaults to the highest one supported.')
+        parser.add_argument('--confirm', action='store_true',
+                            help='Checks that all meters answer at the new baud rate after their restart '
+                                 'and updates the port settings.')
+
+    def handle(self, *args, **options):
+        port = options['port']
+        baudrate = options['baudrate']
+        addresses = list(MeterPort.objects.filter(port=port).values_list('meter__addresse', flat=True))
+
+        if not addresses:
+            raise CommandError('No meters known on port %s, run rescan_meters first.' % port)
+
+        if options['confirm']:
+            self.confirm(port, baudrate, addresses)
+        else:
+            self.configure(port, baudrate, addresses)
+
+    def configure(self, port, baudrate, addresses):
+        """Writes the new baud rate to the meters, which keep using the current one until they are restarted."""
+        current = get_baudrate(port)
+        failed = []
+        for address in addresses:
+            eastron = EastronSDM630(port, address, current)
+            try:
+                if BAUDRATES.get(int(eastron.read_network_baud_rate())) != baudrate:
+                    eastron.write_network_baud_rate(baudrate)
+            except (IOError, ValueError):
+                failed.append(address)
+
+        if failed:
+            raise CommandError('Could not configure the meters with addresses %s.' % ', '.join(map(str, failed)))
+
+        self.stdout.write('Configured %d meters on %s to use %d baud. The port settings have not been changed '
+                          'yet: restart the meters now, then run this command again with --confirm.'
+                          % (len(addresses), port, baudrate))
+
+    def confirm(self, port, baudrate, addresses):
+        """Updates the port settings if all meters answer at the new baud rate."""
+        unreachable = [address for address in addresses
+                       if not EastronSDM630(port, address, baudrate).is_reachable()]
+
+        if unreachable:
+            raise CommandError('The meters with addresses %s do not answer at %d baud, the port settings have '
+                               'not been changed. Make sure they have been restarted.'
+                               % (', '.join(map(str, unreachable)), baudrate))
+
+        set_baudrate(port, baudrate)
+        self.stdout.write('All %d meters on %s answer at %d baud, the port settings have been updated.'
+                          % (len(addresses), port, baudrate))
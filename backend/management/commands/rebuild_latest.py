@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from mmetering.latest import rebuild_latest
+
+
+class Command(BaseCommand):
+    help = 'Sets the latest reading of every meter from the existing meter data.'
+
+    def handle(self, *args, **options):
+        meters = rebuild_latest()
+        self.stdout.write('Set the latest reading of %d meters.' % meters)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from backend.topology import PORTS_LIST, rescan
+from mmetering.models import Meter
+
+
+class Command(BaseCommand):
+    help = 'Probes all ports for the active meters and replaces the cached meter to port mapping.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', action='append', dest='ports',
+                            help='Serial port to probe, can be given multiple times. '
+                                 'Defaults to all discovered tty ports.')
+
+    def handle(self, *args, **options):
+        ports = options['ports'] or PORTS_LIST
+        meters = list(Meter.objects.filter(active=True).select_related('flat'))
+        buses, unreachable = rescan(ports, meters)
+
+        for port, bus_meters in buses.items():
+            self.stdout.write('%s: %s' % (port, ', '.join(str(meter.addresse) for meter in bus_meters)))
+        for meter in unreachable:
+            self.stderr.write('Meter with address %d was not found on any port.' % meter.addresse)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from mmetering.models import Meter
+from mmetering.retention import release_month, restore_month
+from mmetering.summaries import Overview
+
+
+class Command(BaseCommand):
+    help = 'Restores the archived raw values of a meter in a month, replacing the compacted hourly values. ' \
+           'The month is not compacted again until it is released with --release.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('address', type=int, help='Address of the meter.')
+        parser.add_argument('month', help='Any date (DD.MM.YYYY) within the month.')
+        parser.add_argument('--release', action='store_true',
+                            help='Allows a restored month to be compacted again instead of restoring it.')
+
+    def handle(self, *args, **options):
+        month = Overview.parse_date(options['month'], False)
+        if month is None:
+            raise CommandError('Expected the month in the format DD.MM.YYYY.')
+
+        try:
+            meter = Meter.objects.get(addresse=options['address'])
+            if options['release']:
+                if not release_month(meter.pk, month):
+                    raise CommandError('The values of %s have not been restored.' % month.strftime('%m/%Y'))
+                self.stdout.write('Released %s, it will be compacted again.' % month.strftime('%m/%Y'))
+                return
+
+            restored = restore_month(meter.pk, month)
+        except (Meter.DoesNotExist, Meter.MultipleObjectsReturned):
+            raise CommandError('No unique meter with address %d.' % options['address'])
+        except FileNotFoundError:
+            raise CommandError('The values of %s have not been archived.' % month.strftime('%m/%Y'))
+
+        self.stdout.write('Restored %d meter values. Run this command again with --release once they are '
+                          'not needed anymore.' % restored)
@@ -0,0 +1,28 @@
+import signal
+from django.core.management.base import BaseCommand
+from backend.acquisition import AcquisitionService
+
+
+class Command(BaseCommand):
+    help = 'Runs the resident acquisition service which polls all active meters every quarter-hour.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', action='append', dest='ports',
+                            help='Serial port to poll, can be given multiple times. '
+                                 'Defaults to all discovered tty ports.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Maximum number of readings saved with one INSERT.')
+        parser.add_argument('--sample-interval', type=float, default=None,
+                            help='Sample the instantaneous power of all meters every given seconds '
+                                 'and save its minimum, maximum and mean per minute.')
+
+    def handle(self, *args, **options):
+        service = AcquisitionService(ports=options['ports'], batch_size=options['batch_size'],
+                                     sample_interval=options['sample_interval'])
+        signal.signal(signal.SIGTERM, lambda signum, frame: service.stop())
+
+        self.stdout.write('Starting acquisition service, press CTRL-C to quit.')
+        try:
+            service.run()
+        except KeyboardInterrupt:
+            service.stop()
@@ -0,0 +1,34 @@
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from backend.scan import ADDRESSES, save_scanned_meters, scan_ports
+from backend.topology import PORTS_LIST
+
+
+class Command(BaseCommand):
+    help = 'Scans the slave addresses of the given ports for meters and creates or updates them ' \
+           'by their serial number. New meters are created inactive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', action='append', dest='ports',
+                            help='Serial port to scan, can be given multiple times. '
+                                 'Defaults to all discovered tty ports.')
+        parser.add_argument('--first', type=int, default=ADDRESSES.start, help='First slave address to scan.')
+        parser.add_argument('--last', type=int, default=ADDRESSES.stop - 1, help='Last slave address to scan.')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                            help='Only list the meters found, without saving them.')
+
+    def handle(self, *args, **options):
+        ports = options['ports'] or PORTS_LIST
+        started = perf_counter()
+        scanned = scan_ports(ports, range(options['first'], options['last'] + 1))
+        self.stdout.write('Scanned %d port(s) in %.1fs' % (len(ports), perf_counter() - started))
+
+        for port, found in scanned.items():
+            for address, serial in sorted(found.items()):
+                self.stdout.write('%s: slave %d, serial number %d' % (port, address, serial))
+
+        if options['dry_run']:
+            return
+
+        created, updated = save_scanned_meters(scanned)
+        self.stdout.write('%d meter(s) created, %d updated.' % (len(created), len(updated)))
@@ -1,3 +1,60 @@
 from django.db import models
+from mmetering.models import Meter
 
-# Create your models here.
+
+class MeterPort(models.Model):
+    """The serial port a meter was last found on."""
+    meter = models.OneToOneField(Meter, on_delete=models.CASCADE)
+    port = models.CharField(max_length=100)
+    verified_time = models.DateTimeField()
+
+    def __str__(self):
+        return '%s auf %s' % (self.meter, self.port)
+
+
+class Bus(models.Model):
+    """Settings of a serial port meters are connected to."""
+    port = models.CharField(max_length=100, unique=True)
+    baudrate = models.IntegerField(default=19200)
+
+    def __str__(self):
+        return '%s (%d baud)' % (self.port, self.baudrate)
+
+
+class PlanVersion(models.Model):
+    """A single row counting the changes of the acquisition configuration, so that
+    every process can tell whether its cached acquisition plan is stale."""
+    version = models.IntegerField(default=0)
+
+    def __str__(self):
+        return 'Version %d' % self.version
+
+
+class PollingCycle(models.Model):
+    """Telemetry of one polling cycle."""
+    query_time = models.DateTimeField(db_index=True)
+    duration = models.FloatField(help_text="sec")
+    readings = models.IntegerField()
+
+    def __str__(self):
+        return 'Abfrage um %s' % self.query_time
+
+
+class BusCycle(models.Model):
+    """Telemetry of one bus in a polling cycle."""
+    cycle = models.ForeignKey(PollingCycle, on_delete=models.CASCADE, related_name='buses')
+    port = models.CharField(max_length=100)
+    duration = models.FloatField(help_text="sec, until the last read on the bus finished")
+    busy_time = models.FloatField(help_text="sec spent in requests")
+    deadline_margin = models.FloatField(help_text="sec left until the deadline of the cycle")
+
+
+class MeterPoll(models.Model):
+    """Telemetry of the reads of one meter in a polling cycle."""
+    cycle = models.ForeignKey(PollingCycle, on_delete=models.CASCADE, related_name='meters')
+    meter = models.ForeignKey(Meter, on_delete=models.CASCADE)
+    latency = models.FloatField(help_text="sec, duration of the last attempt")
+    attempts = models.SmallIntegerField()
+    timeouts = models.SmallIntegerField()
+    bytes = models.IntegerField(help_text="bytes sent and received")
+    saved = models.BooleanField()
@@ -0,0 +1,115 @@
+"""
+Monthly partitioning of the MeterData table on MySQL.
+
+``setup_partitioning`` converts an existing table once: MySQL requires the
+partitioning column in every unique key and does not support foreign keys on
+partitioned tables, so the primary key is extended by ``saved_time`` and the
+foreign key constraint to the meters is dropped. Afterwards, ``add_partitions``
+has to create the partitions of the coming months before they start, which
+the ``create_partitions_task`` does once a month.
+
+Each partition ``pYYYYMM`` holds the values of one month, so queries on a
+month of values only read one partition.
+"""
+from datetime import datetime
+from django.db import connection
+from mmetering.models import MeterData
+
+TABLE = MeterData._meta.db_table
+MONTHS_AHEAD = 3
+
+
+def add_months(month, months):
+    """Returns the first day of the month ``months`` after ``month``."""
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return 'p%04d%02d' % (month.year, month.month)
+
+
+def partition_definition(month):
+    return "PARTITION %s VALUES LESS THAN (TO_DAYS('%s'))" % (
+        partition_name(month), add_months(month, 1).strftime('%Y-%m-%d'))
+
+
+def check_mysql():
+    if connection.vendor != 'mysql':
+        raise NotImplementedError('Partitioning is only supported on MySQL, not on %s.' % connection.vendor)
+
+
+def get_partitions():
+    """Returns the names of the existing partitions of the MeterData table."""
+    check_mysql()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+                       'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL '
+                       'ORDER BY PARTITION_ORDINAL_POSITION', [TABLE])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def setup_partitioning(months_ahead=MONTHS_AHEAD):
+    """Partitions the MeterData table by month, from its first value until ``months_ahead``
+    months from now. This rewrites the whole table and may take a while.
+
+    Returns:
+        The names of the created partitions.
+    """
+    check_mysql()
+    if get_partitions():
+        raise ValueError('%s is already partitioned.' % TABLE)
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS '
+                       'WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s', [TABLE])
+        for constraint, in cursor.fetchall():
+            cursor.execute('ALTER TABLE %s DROP FOREIGN KEY %s' % (TABLE, constraint))
+
+        first = MeterData.objects.order_by('saved_time').values_list('saved_time', flat=True).first()
+        month = add_months(first or datetime.today(), 0)
+        last = add_months(datetime.today(), months_ahead)
+        months = []
+        while month <= last:
+            months.append(month)
+            month = add_months(month, 1)
+
+        cursor.execute('ALTER TABLE %s DROP PRIMARY KEY, ADD PRIMARY KEY (id, saved_time)' % TABLE)
+        cursor.execute('ALTER TABLE %s PARTITION BY RANGE (TO_DAYS(saved_time)) (%s, '
+                       'PARTITION pmax VALUES LESS THAN MAXVALUE)'
+                       % (TABLE, ', '.join(partition_definition(month) for month in months)))
+
+    return [partition_name(month) for month in months]
+
+
+def add_partitions(months_ahead=MONTHS_AHEAD):
+    """Creates the missing partitions until ``months_ahead`` months from now by
+    splitting them off the catch-all partition ``pmax``. If there is no other
+    partition, they are created from the current month on.
+
+    Returns:
+        The names of the created partitions.
+    """
+    existing = set(get_partitions())
+    if not existing:
+        raise ValueError('%s is not partitioned yet.' % TABLE)
+
+    monthly = [name for name in existing if name != 'pmax']
+    if monthly:
+        latest = max(monthly)
+        month = add_months(datetime(int(latest[1:5]), int(latest[5:7]), 1), 1)
+    else:
+        month = add_months(datetime.today(), 0)
+    last = add_months(datetime.today(), months_ahead)
+    months = []
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+
+    if months:
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE %s REORGANIZE PARTITION pmax INTO (%s, '
+                           'PARTITION pmax VALUES LESS THAN MAXVALUE)'
+                           % (TABLE, ', '.join(partition_definition(month) for month in months)))
+
+    return [partition_name(month) for month in months]
@@ -0,0 +1,129 @@
+"""
+In-memory acquisition plan: the active meters with their flats, the cached
+ports of the meters and the baud rates of the buses.
+
+The plan is built with a few queries and kept across cycles, so that a
+cycle does not read from the database before it talks to the meters. It is
+dropped whenever a Meter, Flat or Bus is saved or deleted (see
+``BackendConfig.ready``). Such changes also increment the PlanVersion, which
+is compared with the version of the plan after every saved cycle
+(``refresh_plan``), to pick up changes made by other processes such as the
+admin before the next cycle. Changes which bypass the model signals, like
+``QuerySet.update``, are picked up after ``PLAN_TTL`` at the latest.
+
+The cached ports are kept up to date by the cycles themselves, see
+``AcquisitionPlan.update_ports``.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from django.db import DatabaseError
+from django.db.models import F
+from backend.eastronSDM630 import DEFAULT_BAUDRATE
+from backend.models import Bus, MeterPort, PlanVersion
+from backend.topology import TTL, get_buses
+from mmetering.models import Meter
+
+logger = logging.getLogger(__name__)
+PLAN_TTL = timedelta(hours=1)
+
+
+class AcquisitionPlan:
+    """Everything a cycle needs to know before it polls the buses.
+
+    Attributes:
+        meters (list): The active meters, with their flats loaded.
+        ports (dict): Maps the pk of each meter to its verified port.
+        baudrates (dict): Maps each configured port to its baud rate.
+        version (int): The PlanVersion the plan has been built from.
+        built (datetime): The time the plan has been built at.
+    """
+    def __init__(self, meters, ports, baudrates, version=0):
+        self.meters = meters
+        self.ports = ports
+        self.baudrates = baudrates
+        self.version = version
+        self.built = datetime.today()
+
+    @classmethod
+    def build(cls):
+        # Read first, so that a change during the build leaves the plan stale.
+        version = get_version()
+        meters = list(Meter.objects.filter(active=True).select_related('flat'))
+        ports = dict(MeterPort.objects
+                     .filter(meter__in=meters, verified_time__gte=datetime.today() - TTL)
+                     .values_list('meter_id', 'port'))
+        baudrates = dict(Bus.objects.values_list('port', 'baudrate'))
+        return cls(meters, ports, baudrates, version)
+
+    def is_stale(self):
+        """Checks the age of the plan and whether the configuration has been changed by another process."""
+        return datetime.today() >= self.built + PLAN_TTL or get_version() != self.version
+
+    def active_meters(self):
+        """Returns the meters which have not been deactivated by a cycle since the plan has been built."""
+        return [meter for meter in self.meters if meter.active]
+
+    def get_buses(self, ports, meters, probe=True):
+        """Same as :py:func:`backend.topology.get_buses`, but uses the cached ports."""
+        return get_buses(ports, meters, probe, cached=self.ports, baudrates=self.baudrates)
+
+    def update_ports(self, verified, lost):
+        """Applies the outcome of a cycle to the cached ports, like ``Cycle.save`` does in the database.
+
+        Args:
+            verified: A dictionary mapping each port to the meters which answered on it.
+            lost: The meters which did not answer anymore.
+        """
+        for port, meters in verified.items():
+            for meter in meters:
+                self.ports[meter.pk] = port
+        for meter in lost:
+            self.ports.pop(meter.pk, None)
+
+    def get_baudrate(self, port):
+        return self.baudrates.get(port, DEFAULT_BAUDRATE)
+
+
+_plan = None
+_lock = threading.Lock()
+
+
+def get_version():
+    return PlanVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+def get_plan():
+    """Returns the current acquisition plan, building it if there is none.
+
+    Raises:
+        DatabaseError: If the plan has to be built and the database is not available.
+    """
+    global _plan
+    with _lock:
+        if _plan is None:
+            _plan = AcquisitionPlan.build()
+        return _plan
+
+
+def refresh_plan():
+    """Rebuilds the acquisition plan if it is stale. Called after a cycle has been
+    saved, so that the next cycle starts without reading from the database.
+    If the database is not available, the previous plan is kept."""
+    global _plan
+    with _lock:
+        try:
+            if _plan is not None and _plan.is_stale():
+                _plan = AcquisitionPlan.build()
+        except DatabaseError:
+            logger.exception('%s: Could not rebuild the acquisition plan, keeping the previous one' % datetime.today())
+
+
+def invalidate_plan(**kwargs):
+    """Drops the current acquisition plan and increments the PlanVersion, so that
+    other processes drop theirs too. Connected to the model signals."""
+    global _plan
+    with _lock:
+        _plan = None
+    if not PlanVersion.objects.filter(pk=1).update(version=F('version') + 1):
+        PlanVersion.objects.get_or_create(pk=1, defaults={'version': 1})
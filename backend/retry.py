@@ -0,0 +1,132 @@
+"""
+Scheduling of meter reads and retries within one polling cycle.
+
+Failed reads are put back into the queue of their bus with an exponential
+backoff instead of being retried right away, so healthy meters are always
+read first. Nothing is read after the deadline of the cycle. Meters which
+fail in several consecutive cycles are quarantined and polled less often.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+from datetime import datetime, timedelta
+from time import sleep
+
+MAX_RETRY = 4
+BACKOFF = 0.1  # sec, doubled with every retry
+QUARANTINE_AFTER = 3  # failed cycles
+MAX_QUARANTINE_CYCLES = 96  # poll a quarantined meter at least once a day
+
+
+class RetryQueue:
+    """Orders the reads of one bus by the time they are due.
+
+    Args:
+        deadline (datetime): No read is started after this point in time.
+    """
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self._heap = []
+        self._counter = itertools.count()
+
+    def push(self, meter, attempt=0, delay=0.0):
+        """Schedules a read of ``meter`` in ``delay`` seconds.
+
+        Returns:
+            False if the read would not be due before the deadline.
+        """
+        due = datetime.today() + timedelta(seconds=delay)
+        if due >= self.deadline:
+            return False
+
+        heapq.heappush(self._heap, (due, next(self._counter), meter, attempt))
+        return True
+
+    def retry(self, meter, attempt):
+        """Schedules another attempt after a failed one, waiting twice as
+        long as before the previous retry.
+
+        Returns:
+            False if there are no retries left or the retry would not be
+            due before the deadline.
+        """
+        if attempt >= MAX_RETRY:
+            return False
+
+        return self.push(meter, attempt + 1, BACKOFF * 2 ** attempt)
+
+    def pending(self):
+        """Returns the meters which have not been read before the deadline."""
+        return [meter for due, count, meter, attempt in sorted(self._heap)]
+
+    def clear(self):
+        self._heap = []
+
+    def next_delay(self):
+        """Returns the seconds until the next read is due, or None if the
+        queue is empty or the deadline has passed."""
+        now = datetime.today()
+        if not self._heap or now >= self.deadline:
+            return None
+
+        return max((self._heap[0][0] - now).total_seconds(), 0.0)
+
+    def pop(self):
+        due, count, meter, attempt = heapq.heappop(self._heap)
+        return meter, attempt
+
+    def __iter__(self):
+        """Yields pairs of meter and attempt as they become due, until
+        the queue is empty or the deadline has passed."""
+        delay = self.next_delay()
+        while delay is not None:
+            sleep(delay)
+            yield self.pop()
+            delay = self.next_delay()
+
+    async def __aiter__(self):
+        """Same as ``__iter__``, but waits without blocking the event loop."""
+        delay = self.next_delay()
+        while delay is not None:
+            await asyncio.sleep(delay)
+            yield self.pop()
+            delay = self.next_delay()
+
+
+class Quarantine:
+    """Keeps track of meters which failed in consecutive cycles.
+
+    After ``QUARANTINE_AFTER`` failed cycles a meter is only polled every
+    2, 4, 8, ... cycles, up to ``MAX_QUARANTINE_CYCLES``, and without retries.
+    """
+    def __init__(self):
+        self._failures = dict()
+        self._lock = threading.Lock()
+
+    def is_quarantined(self, meter):
+        with self._lock:
+            return self._failures.get(meter.pk, (0, None))[0] >= QUARANTINE_AFTER
+
+    def is_due(self, meter, query_time):
+        """Checks whether ``meter`` should be polled in the cycle at ``query_time``."""
+        with self._lock:
+            next_poll = self._failures.get(meter.pk, (0, None))[1]
+            return next_poll is None or query_time >= next_poll
+
+    def succeeded(self, meter):
+        with self._lock:
+            self._failures.pop(meter.pk, None)
+
+    def failed(self, meter, query_time):
+        with self._lock:
+            failures = self._failures.get(meter.pk, (0, None))[0] + 1
+            next_poll = None
+            if failures >= QUARANTINE_AFTER:
+                cycles = min(2 ** (failures - QUARANTINE_AFTER + 1), MAX_QUARANTINE_CYCLES)
+                next_poll = query_time + timedelta(minutes=15 * cycles)
+
+            self._failures[meter.pk] = (failures, next_poll)
+
+
+QUARANTINE = Quarantine()
@@ -0,0 +1,131 @@
+"""
+High-frequency sampling of the instantaneous power of all meters.
+
+Samples are kept in fixed-size ring buffers per meter, backed by arrays of
+doubles, and only their minimum, maximum and mean per minute are saved.
+"""
+import logging
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import perf_counter
+from django.db import connection
+from serial.serialutil import SerialException
+from backend.plan import get_plan
+from mmetering.models import PowerData
+
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """Fixed-size buffer of (timestamp, value) samples, overwriting the oldest sample when full.
+
+    Args:
+        size (int): The number of samples kept.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.times = array('d', bytes(8 * size))
+        self.values = array('d', bytes(8 * size))
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def append(self, timestamp, value):
+        index = self.count % self.size
+        self.times[index] = timestamp
+        self.values[index] = value
+        self.count += 1
+
+    def between(self, start, end):
+        """Returns the values sampled from ``start`` until before ``end`` (POSIX timestamps)."""
+        return [self.values[i] for i in range(len(self)) if start <= self.times[i] < end]
+
+    def aggregate(self, start, end):
+        """Returns a tuple (min, max, mean) of the values sampled in a timespan,
+        or None if there are none."""
+        values = self.between(start, end)
+        if not values:
+            return None
+
+        return min(values), max(values), sum(values) / len(values)
+
+
+class PowerSampler:
+    """Reads the instantaneous power of all active meters every ``interval`` seconds.
+
+    Uses the instruments and bus locks of an AcquisitionService, so that
+    sampling pauses while the meters are polled at the quarter-hour.
+
+    Args:
+        service (AcquisitionService): The service providing instruments and bus locks.
+        interval (float): Seconds between two samples of a meter.
+        size (int): Samples kept per meter, defaults to a quarter-hour.
+    """
+    def __init__(self, service, interval=5.0, size=None):
+        self.service = service
+        self.interval = interval
+        self.size = size or int(15 * 60 / interval)
+        self.buffers = dict()
+
+    def get_buffer(self, meter):
+        if meter.pk not in self.buffers:
+            self.buffers[meter.pk] = RingBuffer(self.size)
+        return self.buffers[meter.pk]
+
+    def sample_bus(self, port, meters, baudrate):
+        """Reads the power of all meters on one bus once, at the baud rate of the bus."""
+        with self.service.bus_lock(port):
+            for meter in meters:
+                try:
+                    eastron = self.service.get_instrument(port, meter.addresse)
+                    if eastron.serial.baudrate != baudrate:
+                        eastron.set_baudrate(baudrate)
+                    value = sum(eastron.read_power_values())
+                except (IOError, ValueError, SerialException):
+                    continue
+
+                self.get_buffer(meter).append(datetime.today().timestamp(), value)
+
+    def save_aggregates(self, minute):
+        """Saves min, max and mean power of every meter for the minute starting at ``minute``."""
+        start = minute.timestamp()
+        rows = []
+        for pk, buffer in self.buffers.items():
+            aggregate = buffer.aggregate(start, start + 60)
+            if aggregate is not None:
+                power_min, power_max, power_mean = aggregate
+                rows.append(PowerData(meter_id=pk, saved_time=minute, power_min=power_min,
+                                      power_max=power_max, power_mean=power_mean))
+
+        PowerData.objects.bulk_create(rows)
+
+    def run(self):
+        """Samples until the service is stopped, saving the aggregates once a minute."""
+        minute = datetime.today().replace(second=0, microsecond=0)
+        buses = dict()
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(len(self.service.ports), 1)) as executor:
+                while not self.service.stopped.is_set():
+                    started = perf_counter()
+                    if not buses:
+                        plan = get_plan()
+                        buses, unreachable = plan.get_buses(self.service.ports, plan.active_meters(), probe=False)
+
+                    list(executor.map(lambda item: self.sample_bus(*item, plan.get_baudrate(item[0])),
+                                      buses.items()))
+
+                    if datetime.today() >= minute + timedelta(minutes=1):
+                        try:
+                            self.save_aggregates(minute)
+                        except Exception:
+                            logger.exception('%s: Could not save power aggregates' % datetime.today())
+                        minute = datetime.today().replace(second=0, microsecond=0)
+                        # Pick up changed meters once a minute.
+                        buses = dict()
+
+                    self.service.stopped.wait(max(self.interval - (perf_counter() - started), 0))
+        finally:
+            connection.close()
@@ -0,0 +1,129 @@
+"""
+Discovery of the meters on a bus, for commissioning new installations.
+
+Every slave address is asked for its serial number. Since most addresses
+do not answer, the timeout starts short and is adapted to the response
+times of the meters found so far, instead of waiting the full serial
+timeout for each of the 247 addresses.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from django.db import transaction
+from serial.serialutil import SerialException
+from backend.eastronSDM630 import CHARACTER_BITS, RESPONSE_TIME, EastronSDM630
+from backend.models import MeterPort
+from backend.plan import invalidate_plan
+from backend.topology import get_baudrate, save_ports
+from mmetering.models import Flat, Meter
+import logging
+
+logger = logging.getLogger(__name__)
+ADDRESSES = range(1, 248)
+SCAN_TIMEOUT = 0.1  # sec, until the first meter answered
+MIN_SCAN_TIMEOUT = 0.02  # sec
+# The timeout is this multiple of the slowest response so far.
+TIMEOUT_FACTOR = 3
+
+
+def scan_port(port, addresses=ADDRESSES):
+    """Asks every slave address on a port for its serial number.
+
+    Returns:
+        A dictionary mapping the addresses which answered to their serial numbers.
+    """
+    baudrate = get_baudrate(port)
+    # Transmission of the request and of the response.
+    transmission = (8 + 9) * CHARACTER_BITS / baudrate  # sec
+    timeout = SCAN_TIMEOUT
+    slowest = 0.0
+    found = dict()
+
+    for address in addresses:
+        try:
+            eastron = EastronSDM630(port, address, baudrate)
+        except SerialException:
+            logger.error('Port %s not available' % port)
+            break
+
+        eastron.serial.timeout = timeout + transmission
+        started = perf_counter()
+        try:
+            found[address] = eastron.read_serial_number()
+        except (IOError, ValueError):
+            continue
+        finally:
+            eastron.set_baudrate(baudrate)
+
+        slowest = max(slowest, perf_counter() - started - eastron.silent_interval)
+        timeout = min(max(TIMEOUT_FACTOR * slowest, MIN_SCAN_TIMEOUT), RESPONSE_TIME)
+
+    return found
+
+
+def scan_ports(ports, addresses=ADDRESSES):
+    """Scans every port in its own worker thread.
+
+    Returns:
+        A dictionary mapping each port to the result of ``scan_port``.
+    """
+    if not ports:
+        return dict()
+
+    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+        return dict(zip(ports, executor.map(lambda port: scan_port(port, addresses), ports)))
+
+
+def save_scanned_meters(scanned):
+    """Creates or updates a Meter for every meter found by ``scan_ports``.
+
+    Known meters are recognized by their serial number first, so that a
+    meter which has been given a new address keeps its data. Otherwise a meter
+    cached on the same port with the same address is taken, unless its serial
+    number was found elsewhere, since several buses usually use the same
+    addresses. New meters are created inactive, each with a flat named after
+    its address and port, which can then be renamed in the admin.
+
+    Returns:
+        A tuple of the lists of created and updated meters.
+    """
+    meters = list(Meter.objects.all())
+    ports = dict(MeterPort.objects.values_list('meter_id', 'port'))
+    serials = {str(serial) for found in scanned.values() for serial in found.values()}
+    by_serial = {meter.seriennummer: meter for meter in meters}
+    by_port = {(ports[meter.pk], meter.addresse): meter for meter in meters
+               if meter.pk in ports and meter.seriennummer not in serials}
+    found_meters = {port: [] for port in scanned}
+    updated = []
+    new = []
+
+    for port, found in scanned.items():
+        for address, serial in sorted(found.items()):
+            meter = by_serial.get(str(serial)) or by_port.pop((port, address), None)
+            if meter is None:
+                new.append((port, address, str(serial)))
+                continue
+
+            found_meters[port].append(meter)
+            if (meter.addresse, meter.seriennummer) != (address, str(serial)):
+                meter.addresse = address
+                meter.seriennummer = str(serial)
+                updated.append(meter)
+
+    with transaction.atomic():
+        for meter in updated:
+            Meter.objects.filter(pk=meter.pk).update(addresse=meter.addresse, seriennummer=meter.seriennummer)
+
+        # One by one instead of bulk_create, which does not set primary keys on MySQL, so that
+        # every meter gets the flat just created for it and not one left behind by an earlier scan.
+        created = []
+        for port, address, serial in new:
+            flat = Flat.objects.create(name='Zähler %d an %s' % (address, port), modus='IM')
+            meter = Meter.objects.create(flat=flat, addresse=address, seriennummer=serial, active=False)
+            created.append(meter)
+            found_meters[port].append(meter)
+
+        for port, port_meters in found_meters.items():
+            save_ports(port, port_meters)
+
+    invalidate_plan()
+    return created, updated
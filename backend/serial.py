@@ -1,146 +1,354 @@
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import perf_counter
+from django.db import DatabaseError, connection, transaction
 from serial.serialutil import SerialException
 from backend.eastronSDM630 import EastronSDM630
-from mmetering.models import Meter, MeterData
-from mmetering_server.settings.defaults import MODBUS_PORT
-import serial.tools.list_ports
+from backend.journal import JOURNAL
+from backend.plan import get_plan, refresh_plan
+from backend.retry import QUARANTINE, RetryQueue
+from backend.telemetry import BusStats, save_telemetry
+from backend.topology import PORTS_LIST, get_baudrate, invalidate_ports, verify_ports
+from mmetering.models import Meter, MeterData, PowerQualityData
+from mmetering_server.settings.defaults import ACQUISITION_ENGINE, ACQUISITION_POWER_QUALITY
 from celery.utils.log import get_task_logger
 
 
 logger = get_task_logger(__name__)
-MAX_RETRY = 4
-PORTS_LIST = [port for port, desc, hwid in serial.tools.list_ports.grep('tty')]
+CYCLE_MINUTES = 15
+# Time left between the last read of a cycle and the start of the next one.
+DEADLINE_MARGIN = timedelta(seconds=30)
 
-if MODBUS_PORT in PORTS_LIST:
-    # Move manually configured port to the front in
-    # order to test this one first.
-    PORTS_LIST.remove(MODBUS_PORT)
-    PORTS_LIST.insert(0, MODBUS_PORT)
+
+def next_quarter_hour(now):
+    """Returns the start of the quarter-hour following ``now``."""
+    slot = now.replace(minute=now.minute - now.minute % CYCLE_MINUTES, second=0, microsecond=0)
+    return slot + timedelta(minutes=CYCLE_MINUTES)
+
+
+class Cycle:
+    """Collects all database changes of one polling cycle, so that they can
+    be written at once instead of one query per meter.
+
+    Every reading is journaled as soon as it has been read, so that it survives
+    an unavailable database or a failure later in the cycle.
+
+    Attributes:
+        query_time (datetime): The datetime the data will be saved with.
+        deadline (datetime): No meter is read after this point in time.
+        journal (Journal): The journal the readings are appended to.
+        readings (list): Unsaved MeterData objects.
+        unjournaled (list): Readings which could not be journaled when they were read.
+        started (list): Meters whose start_datetime has to be set.
+        deactivated (list): Meters whose end_datetime has passed.
+        retried (list): Meters whose read had to be retried, once per retry.
+        quality (list): Unsaved PowerQualityData objects, None if the power
+            quality is not read in this cycle.
+        buses (list): The BusStats of all polled buses.
+        verified (dict): Maps each polled port to the meters which answered on it.
+        lost (list): Meters which did not answer anymore.
+        duration (float): Seconds the polling took.
+    """
+    def __init__(self, query_time, power_quality=None, journal=None):
+        self.query_time = query_time
+        self.deadline = next_quarter_hour(query_time) - DEADLINE_MARGIN
+        self.start_time = datetime.today()
+        self.journal = journal or JOURNAL
+        self.readings = []
+        self.unjournaled = []
+        self.started = []
+        self.deactivated = []
+        self.retried = []
+        if power_quality is None:
+            power_quality = ACQUISITION_POWER_QUALITY
+        self.quality = [] if power_quality else None
+        self.buses = []
+        self.verified = dict()
+        self.lost = []
+        self.duration = 0.0
+
+    def add_reading(self, reading):
+        """Journals a reading right after it has been read and adds it to the cycle."""
+        try:
+            self.journal.append([reading])
+        except IOError:
+            logger.exception('%s: Could not journal the reading of meter %d' % (datetime.today(), reading.meter_id))
+            self.unjournaled.append(reading)
+        self.readings.append(reading)
+
+    def start(self, meter):
+        meter.start_datetime = self.start_time
+        self.started.append(meter)
+
+    def deactivate(self, meter):
+        meter.active = False
+        self.deactivated.append(meter)
+
+    def save(self, batch_size=None):
+        """Journals the readings which could not be journaled while polling. Then writes
+        all meter changes with one UPDATE each, along with the cached ports, the power
+        quality and the telemetry, in a single transaction and replays the journal into
+        MeterData in batches. Finally, the acquisition plan is rebuilt if it is stale.
+
+        Args:
+            batch_size (int): The maximum number of objects per INSERT.
+        """
+        self.journal.append(self.unjournaled)
+        self.unjournaled = []
+        with transaction.atomic():
+            if self.started:
+                Meter.objects.filter(pk__in=[meter.pk for meter in self.started]) \
+                    .update(start_datetime=self.start_time)
+            if self.deactivated:
+                Meter.objects.filter(pk__in=[meter.pk for meter in self.deactivated]) \
+                    .update(active=False)
+            for port, meters in self.verified.items():
+                verify_ports(port, meters)
+            invalidate_ports(self.lost)
+            if self.quality:
+                PowerQualityData.objects.bulk_create(self.quality, batch_size=batch_size)
+            if self.buses:
+                save_telemetry(self)
+        self.journal.replay(batch_size)
+        refresh_plan()
 
 
 # TODO: Refactor method naming and docstring style
-def save_meter_data():
+def save_meter_data(engine=None):
     """
-    Loops through a EastronSDM630 object list, checks wether a startdate
-    has already been set or not and requests the current Import/Export
-    by calling the corresponding EastronSDM630 method.
+    Polls all active meters and saves all readings of the cycle at once.
     Gets called by the ```save_meter_data_task```.
 
     Returns:
         A string containing all queried meter ID's
     """
-    port = choose_port(PORTS_LIST)
-    query_time = datetime.today().replace(microsecond=0, second=0)
-    failed_attempts = dict()
-    diagnose_str = 'Requested devices on port %s:\n' % port
+    cycle = Cycle(datetime.today().replace(microsecond=0, second=0))
+    diagnose_str = poll_meters(cycle, engine=engine)
+    cycle.save()
+    return diagnose_str
 
-    if port == 0:
-        diagnose_str = 'Could not find a serial port with connected meters.'
-        return diagnose_str
+
+def poll_meters(cycle, ports=None, get_instrument=EastronSDM630, engine=None):
+    """
+    Maps all active meters to the serial ports (buses) they are connected to,
+    using the cached acquisition plan and topology where possible, and polls every bus concurrently,
+    so that the duration of a cycle is bounded by the slowest bus and not by the
+    total number of meters. Quarantined meters are left out until they are due again.
+
+    Args:
+        cycle: The Cycle collecting the readings and meter changes.
+        ports: A list of serial port names, defaults to all discovered ports.
+        get_instrument: A callable returning the EastronSDM630 instrument for
+            a port and slave address, defaults to creating a new one.
+        engine: 'serial' polls every bus in its own worker thread, 'asyncio' polls
+            all buses from one event loop. Defaults to the ACQUISITION_ENGINE setting.
+
+    Returns:
+        A string containing all queried meter ID's
+    """
+    try:
+        plan = get_plan()
+    except DatabaseError:
+        logger.exception('%s: Could not build the acquisition plan' % datetime.today())
+        return 'Could not build the acquisition plan, the database is not available.'
+    meters = plan.active_meters()
+
+    if not meters:
+        logger.error('There are no active meters registered in the database.')
+        return 'Could not find a serial port with connected meters.'
+
+    quarantined = [meter for meter in meters if not QUARANTINE.is_due(meter, cycle.query_time)]
+    meters = [meter for meter in meters if meter not in quarantined]
+    buses, unreachable = plan.get_buses(PORTS_LIST if ports is None else ports, meters)
+
+    if not buses:
+        return 'Could not find a serial port with connected meters.'
+
+    started = perf_counter()
+    if (engine or ACQUISITION_ENGINE) == 'asyncio':
+        from backend.aiomodbus import poll_buses
+        diagnose_str = poll_buses(buses, cycle, plan.baudrates)
     else:
-        for meter in Meter.objects.filter(active=True):
-            meter_diagnose_str = 'Slave %d, %s' % (meter.addresse, meter.flat.modus)
-            try:
-                eastron = EastronSDM630(port, meter.addresse)
-            except SerialException:
-                logger.error('Port %s not available on meter with address %d' % (port, meter.addresse))
-                continue
+        with ThreadPoolExecutor(max_workers=len(buses)) as executor:
+            futures = [executor.submit(poll_bus, port, bus_meters, cycle, get_instrument, plan.get_baudrate(port))
+                       for port, bus_meters in buses.items()]
+            diagnose_str = ''.join(future.result() for future in futures)
+    cycle.duration = perf_counter() - started
+    plan.update_ports(cycle.verified, cycle.lost)
+
+    for meter in unreachable:
+        QUARANTINE.failed(meter, cycle.query_time)
+        diagnose_str += 'Slave %d, %s: not found on any port\n' % (meter.addresse, meter.flat.modus)
+    for meter in quarantined:
+        diagnose_str += 'Slave %d, %s: skipped (quarantined)\n' % (meter.addresse, meter.flat.modus)
+
+    return diagnose_str
 
+
+class BusPoll:
+    """Keeps track of the reads on one bus during a cycle.
+
+    Checks wether a startdate has already been set or not for each meter and
+    schedules the reads, healthy meters first. Failed reads are retried with an
+    exponential backoff after the other meters have been read, as long as the
+    deadline of the cycle allows it.
+
+    Attributes:
+        port (str): The serial port of the bus.
+        meters (list): The meters connected to the bus.
+        cycle (Cycle): The Cycle collecting the readings and meter changes.
+        reads (RetryQueue): The scheduled reads.
+        stats (BusStats): The telemetry of the bus.
+    """
+    def __init__(self, port, meters, cycle):
+        self.port = port
+        self.meters = meters
+        self.cycle = cycle
+        self.reads = RetryQueue(cycle.deadline)
+        self.stats = BusStats(port)
+        cycle.buses.append(self.stats)
+        self.status = dict()
+        self.verified = []
+        self.lost = []
+
+        # Read healthy meters first, quarantined ones get a single attempt afterwards.
+        for meter in sorted(meters, key=QUARANTINE.is_quarantined):
             if meter.start_datetime is not None:
-                if meter.start_datetime > query_time:
+                if meter.start_datetime > cycle.query_time:
                     # start_datetime is in the future, don't query this meter
                     continue
             else:
-                meter.set_start_datetime()
+                cycle.start(meter)
 
             if meter.end_datetime is not None:
-                if meter.end_datetime <= query_time:
-                    meter.deactivate()
+                if meter.end_datetime <= cycle.query_time:
+                    cycle.deactivate(meter)
 
-            # TODO: Use tenacity in order to handle retries with MAX_RETRIES
-            if request_meter_data(meter, eastron, query_time):
-                meter_diagnose_str += ': saved'
-            else:
-                meter_diagnose_str += ': not saved (no communication)'
-                failed_attempts[meter.addresse] = [meter, eastron, query_time, MAX_RETRY]
+            self.status[meter.addresse] = ': not saved (deadline)'
+            self.reads.push(meter)
+
+    def done(self, meter, attempt, success):
+        """Records the outcome of a read and schedules a retry if it failed."""
+        if success:
+            QUARANTINE.succeeded(meter)
+            self.verified.append(meter)
+            self.status[meter.addresse] = ': saved' if attempt == 0 else ': saved after %d retries' % attempt
+        elif not QUARANTINE.is_quarantined(meter) and self.reads.retry(meter, attempt):
+            self.cycle.retried.append(meter)
+            logger.info('Retrying meter with address %d' % meter.addresse)
+        else:
+            logger.error('%s: Could not reach meter with address %d after %d retries' %
+                         (datetime.today(), meter.addresse, attempt))
+            QUARANTINE.failed(meter, self.cycle.query_time)
+            self.lost.append(meter)
+            self.status[meter.addresse] = ': not saved (no communication)'
+
+    def port_unavailable(self, meter):
+        logger.error('Port %s not available on meter with address %d' % (self.port, meter.addresse))
+        self.status[meter.addresse] = ': not saved (port not available)'
+
+    def finish(self):
+        """Hands the outcome of all reads to the cycle, which updates the cached topology when it is saved."""
+        self.stats.finish()
+        for meter in self.reads.pending():
+            logger.warning('%s: Meter with address %d could not be read before the deadline' %
+                           (datetime.today(), meter.addresse))
+
+        self.cycle.verified[self.port] = self.verified
+        # Look for lost meters on all ports when they are polled the next time.
+        self.cycle.lost.extend(self.lost)
 
-            diagnose_str += meter_diagnose_str + '\n'
+    def report(self):
+        """Returns a string containing all queried meter ID's on this bus."""
+        diagnose_str = 'Requested devices on port %s:\n' % self.port
+        for meter in self.meters:
+            if meter.addresse in self.status:
+                diagnose_str += 'Slave %d, %s%s\n' % (meter.addresse, meter.flat.modus, self.status[meter.addresse])
 
-        handle_failed_attempts(failed_attempts)
         return diagnose_str
 
 
-def handle_failed_attempts(failed_attempts):
-    if failed_attempts == {}:
-        return
-    else:
-        remove = []
-
-        for key in list(failed_attempts.keys()):
-            meter, eastron, query_time, retry = failed_attempts[key]
-            if retry == 0:
-                logger.exception('%s: Could not reach meter with address %d after %d retries' %
-                                 (datetime.today(), meter.addresse, MAX_RETRY))
-                remove.append(key)
+def poll_bus(port, meters, cycle, get_instrument=EastronSDM630, baudrate=None):
+    """
+    Reads the meters connected to one bus and requests the current Import/Export
+    by calling the corresponding EastronSDM630 method.
+
+    Args:
+        port: The serial port of the bus.
+        meters: The meters connected to the bus.
+        cycle: The Cycle collecting the readings and meter changes.
+        get_instrument: A callable returning the EastronSDM630 instrument for
+            a port and slave address, defaults to creating a new one.
+        baudrate: The baud rate of the bus, queried from the database if not given.
+
+    Returns:
+        A string containing all queried meter ID's on this bus.
+    """
+    poll = BusPoll(port, meters, cycle)
+
+    try:
+        if baudrate is None:
+            baudrate = get_baudrate(port)
+        for meter, attempt in poll.reads:
+            try:
+                eastron = get_instrument(port, meter.addresse)
+            except SerialException:
+                poll.port_unavailable(meter)
                 continue
 
-            logger.info('Retrying meter with address %d' % meter.addresse)
-            if request_meter_data(meter, eastron, query_time):
-                logger.debug('Success on meter with address %d' % meter.addresse)
-                remove.append(key)
-            else:
-                failed_attempts[key][3] = retry - 1
-                logger.debug('Remaining attempts for meter with address %d: %d' % (meter.addresse, retry - 1))
+            if eastron.serial.baudrate != baudrate:
+                eastron.set_baudrate(baudrate)
+
+            before = eastron.counters()
+            started = perf_counter()
+            success = request_meter_data(meter, eastron, cycle.query_time, cycle)
+            poll.stats.record(meter, success, perf_counter() - started, before, eastron.counters())
+            poll.done(meter, attempt, success)
 
-        for index in remove:
-            del failed_attempts[index]
+        poll.finish()
+    finally:
+        # Every worker thread opens its own database connection.
+        connection.close()
 
-        handle_failed_attempts(failed_attempts)
+    return poll.report()
 
 
-def request_meter_data(meter, eastron, query_time):
+def request_meter_data(meter, eastron, query_time, cycle=None):
     try:
         if meter.flat.modus == 'IM':
-            value = eastron.read_total_import()
-            value_l1 = eastron.read_import_L1()
-            value_l2 = eastron.read_import_L2()
-            value_l3 = eastron.read_import_L3()
+            values = eastron.read_import_values()
         else:
-            value = eastron.read_total_export()
-            value_l1 = eastron.read_export_L1()
-            value_l2 = eastron.read_export_L2()
-            value_l3 = eastron.read_export_L3()
-
-        meter_data = MeterData(
-            meter_id=meter.pk,
-            saved_time=query_time,
-            value=value,
-            value_l1=value_l1,
-            value_l2=value_l2,
-            value_l3=value_l3
-        )
-        meter_data.save()
-    except IOError:
+            values = eastron.read_export_values()
+
+        meter_data = create_meter_data(meter, query_time, values)
+    except (IOError, ValueError):
+        # minimalmodbus raises a ValueError on a broken response.
         return False
 
-    return True
+    if cycle is None:
+        JOURNAL.append([meter_data])
+        JOURNAL.replay()
+        return True
 
+    cycle.add_reading(meter_data)
+    if cycle.quality is not None:
+        try:
+            cycle.quality.append(PowerQualityData(meter_id=meter.pk, saved_time=query_time,
+                                                  **eastron.read_power_quality_values()))
+        except (IOError, ValueError):
+            logger.info('Could not read the power quality of meter with address %d' % meter.addresse)
 
-def choose_port(ports):
-    meter = Meter.objects.filter(active=True).first()
+    return True
 
-    if meter is None:
-        logger.error('There are no active meters registered in the database.')
-        return 0
 
-    for port in ports:
-        try:
-            eastron = EastronSDM630(port, meter.addresse)
-            if eastron.is_reachable():
-                return port
-        except SerialException:
-            logger.error('%s: Port %s not available on meter with address %d'
-                         % (datetime.today(), port, meter.addresse))
-            continue
-
-    return 0
+def create_meter_data(meter, query_time, values):
+    """Creates an unsaved MeterData object from a tuple (total, L1, L2, L3)."""
+    value, value_l1, value_l2, value_l3 = values
+    return MeterData(
+        meter_id=meter.pk,
+        saved_time=query_time,
+        value=value,
+        value_l1=value_l1,
+        value_l2=value_l2,
+        value_l3=value_l3
+    )
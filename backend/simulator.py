@@ -0,0 +1,186 @@
+"""
+Software simulation of a bus with Eastron SDM630 meters, served over a pseudo-terminal.
+
+The simulated meters answer the registers defined in :py:mod:`backend.eastronSDM630`,
+so that the acquisition path can be load-tested without real hardware::
+
+    with SimulatedBus(range(1, 201), latency=0.01, error_rate=0.01) as bus:
+        eastron = EastronSDM630(bus.port, 1)
+"""
+import os
+import random
+import select
+import struct
+import threading
+import time
+import tty
+from backend import eastronSDM630
+from backend.eastronSDM630 import (
+    BAUDRATES, CHARACTER_BITS, DEFAULT_BAUDRATE, FUNC_CODE_HOLDING_REG, FUNC_CODE_INPUT_REG, crc16
+)
+
+FUNC_CODE_WRITE_REGISTERS = 16
+
+
+class SimulatedSDM630:
+    """Register map of one simulated meter.
+
+    The energy counters grow with every read, all other quantities
+    vary slightly around typical values.
+
+    Args:
+        slaveaddress (int): slave address in the range 1 to 247
+    """
+    def __init__(self, slaveaddress, baudrate=DEFAULT_BAUDRATE):
+        self.slaveaddress = slaveaddress
+        self.holding = {
+            int(eastronSDM630.REG_SDMNetworkBaudRate, 16):
+                float({value: code for code, value in BAUDRATES.items()}[baudrate]),
+            int(eastronSDM630.REG_SDMSerialNumber, 16): 17000000 + slaveaddress,
+        }
+        self.input = dict()
+        for phase in range(3):
+            self.input[int(eastronSDM630.REG_SDML1Voltage, 16) + 2 * phase] = 230.0
+            self.input[int(eastronSDM630.REG_SDML1Current, 16) + 2 * phase] = 5.0
+            self.input[int(eastronSDM630.REG_SDML1Power, 16) + 2 * phase] = 1150.0
+            self.input[int(eastronSDM630.REG_SDML1Import, 16) + 2 * phase] = 100.0 * slaveaddress
+            self.input[int(eastronSDM630.REG_SDML1Export, 16) + 2 * phase] = 10.0 * slaveaddress
+            self.input[int(eastronSDM630.REG_SDML1THDVoltageNeutral, 16) + 2 * phase] = 2.0
+        self.input[int(eastronSDM630.REG_SDMAvgTHDVoltageNeutral, 16)] = 2.0
+        self.input[int(eastronSDM630.REG_SDMFrequency, 16)] = 50.0
+        self.update_totals()
+
+    def update_totals(self):
+        for phases, total in ((eastronSDM630.REG_SDML1Import, eastronSDM630.REG_SDMTotalImport),
+                              (eastronSDM630.REG_SDML1Export, eastronSDM630.REG_SDMTotalExport)):
+            first = int(phases, 16)
+            self.input[int(total, 16)] = sum(self.input[first + 2 * phase] for phase in range(3))
+
+    def tick(self):
+        """Advances the counters and varies the instantaneous values."""
+        for phase in range(3):
+            self.input[int(eastronSDM630.REG_SDML1Import, 16) + 2 * phase] += random.uniform(0.0, 0.05)
+            self.input[int(eastronSDM630.REG_SDML1Export, 16) + 2 * phase] += random.uniform(0.0, 0.01)
+            self.input[int(eastronSDM630.REG_SDML1Power, 16) + 2 * phase] = random.uniform(0.0, 3000.0)
+            self.input[int(eastronSDM630.REG_SDML1Voltage, 16) + 2 * phase] = random.gauss(230.0, 1.0)
+        self.update_totals()
+
+    def read(self, functioncode, registeraddress, count):
+        """Returns ``count`` registers as bytes, unknown registers read as zero.
+        Integers are packed as unsigned 32 bit, all other values as floats."""
+        registers = self.holding if functioncode == FUNC_CODE_HOLDING_REG else self.input
+        if functioncode == FUNC_CODE_INPUT_REG:
+            self.tick()
+
+        payload = b''
+        for address in range(registeraddress, registeraddress + count, 2):
+            value = registers.get(address, 0.0)
+            payload += struct.pack('>I' if isinstance(value, int) else '>f', value)
+
+        return payload[:2 * count]
+
+    def write(self, registeraddress, payload):
+        for offset in range(0, len(payload) - 3, 4):
+            self.holding[registeraddress + offset // 2] = struct.unpack('>f', payload[offset:offset + 4])[0]
+
+
+class SimulatedBus:
+    """A bus of simulated meters behind a pseudo-terminal.
+
+    Requests written to ``port`` are answered by the meter with the
+    requested slave address. Requests for unknown addresses and a share of
+    ``error_rate`` of all requests are not answered at all, like on a real bus.
+
+    Args:
+        addresses: The slave addresses of the simulated meters.
+        latency (float): Seconds a meter takes before it answers.
+        error_rate (float): Probability of a request not being answered.
+        baudrate (int): Simulated line speed, the transmission time of each
+            response is added to the latency.
+    """
+    def __init__(self, addresses, latency=0.0, error_rate=0.0, baudrate=DEFAULT_BAUDRATE):
+        self.meters = {address: SimulatedSDM630(address, baudrate) for address in addresses}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.baudrate = baudrate
+        self.requests = 0
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def port(self):
+        return os.ttyname(self._slave)
+
+    def start(self):
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self.serve, name='sdm630-simulator', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def serve(self):
+        buffer = b''
+        while not self._stopped.is_set():
+            if not select.select([self._master], [], [], 0.1)[0]:
+                # A silent line ends a broken frame.
+                buffer = b''
+                continue
+
+            buffer += os.read(self._master, 1024)
+            while True:
+                length = self.frame_length(buffer)
+                if length is None or len(buffer) < length:
+                    break
+
+                frame, buffer = buffer[:length], buffer[length:]
+                response = self.answer(frame)
+                if response is not None:
+                    time.sleep(self.latency + len(response) * CHARACTER_BITS / self.baudrate)
+                    os.write(self._master, response)
+
+    @staticmethod
+    def frame_length(buffer):
+        """Returns the length of the request at the start of ``buffer``, if already known."""
+        if len(buffer) < 2:
+            return None
+        if buffer[1] == FUNC_CODE_WRITE_REGISTERS:
+            return 9 + buffer[6] if len(buffer) >= 7 else None
+
+        return 8
+
+    def answer(self, frame):
+        """Returns the response to a request frame, or None if it stays unanswered."""
+        self.requests += 1
+        if crc16(frame[:-2]) != frame[-2:] or frame[0] not in self.meters:
+            return None
+        if random.random() < self.error_rate:
+            return None
+
+        meter = self.meters[frame[0]]
+        functioncode, registeraddress, count = struct.unpack('>BHH', frame[1:6])
+        if functioncode in (FUNC_CODE_HOLDING_REG, FUNC_CODE_INPUT_REG):
+            payload = meter.read(functioncode, registeraddress, count)
+            response = struct.pack('>BBB', frame[0], functioncode, len(payload)) + payload
+        elif functioncode == FUNC_CODE_WRITE_REGISTERS:
+            meter.write(registeraddress, frame[7:-2])
+            response = frame[:6]
+        else:
+            # Illegal function
+            response = struct.pack('>BBB', frame[0], functioncode | 0x80, 1)
+
+        return response + crc16(response)
@@ -1,8 +1,11 @@
 from celery.schedules import crontab
 from celery.task import periodic_task
 from celery.signals import after_setup_task_logger
+from django.conf import settings
+from backend.partitions import add_partitions
 from backend.serial import save_meter_data
 from mmetering.emails import send_attachment_email
+from mmetering.retention import compact_old_data
 import logging
 
 
@@ -42,6 +45,10 @@ def save_meter_data_task():
     logger = save_meter_data_task.get_logger()
     logger.setLevel(logging.DEBUG)
 
+    if settings.ACQUISITION_DAEMON:
+        # Meters are polled by the run_acquisition service.
+        return
+
     saved_meters = save_meter_data()
     logger.debug(saved_meters)
 
@@ -58,3 +65,34 @@ def send_meter_data_email_task():
     on the first of each month
     """
     send_attachment_email()
+
+
+@periodic_task(
+    run_every=(crontab(0, 0, day_of_month='1')),
+    name="create_partitions_task",
+    ignore_result=True
+)
+def create_partitions_task():
+    """
+    Creates the monthly partitions of the coming
+    months if the meter data table is partitioned
+    """
+    try:
+        add_partitions()
+    except (NotImplementedError, ValueError):
+        # Not on MySQL or not partitioned.
+        pass
+
+
+@periodic_task(
+    run_every=(crontab(minute=0, hour=3)),
+    name="compact_old_data_task",
+    ignore_result=True
+)
+def compact_old_data_task():
+    """
+    Archives raw meter data older than the retention
+    period and keeps hourly values in the database
+    """
+    logger = compact_old_data_task.get_logger()
+    logger.info('Compacted %d meter values' % compact_old_data())
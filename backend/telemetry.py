@@ -0,0 +1,78 @@
+"""
+Structured telemetry of the polling cycles: per-meter read latency, attempts,
+timeouts and bytes on the wire, and per-bus busy time and deadline margin.
+"""
+from datetime import datetime, timedelta
+from time import perf_counter
+from backend.models import PollingCycle, BusCycle, MeterPoll
+
+RETENTION = timedelta(days=7)
+
+
+class MeterStats:
+    """Counters of the reads of one meter in a cycle."""
+    def __init__(self, meter):
+        self.meter = meter
+        self.attempts = 0
+        self.timeouts = 0
+        self.bytes = 0
+        self.latency = 0.0
+        self.saved = False
+
+
+class BusStats:
+    """Counters of the reads on one bus in a cycle.
+
+    Args:
+        port (str): The serial port of the bus.
+    """
+    def __init__(self, port):
+        self.port = port
+        self.busy_time = 0.0
+        self.duration = 0.0
+        self.finished = None
+        self.meters = dict()
+        self._started = perf_counter()
+
+    def record(self, meter, success, latency, before, after):
+        """Records one attempt to read ``meter``.
+
+        Args:
+            meter: The Meter which has been read.
+            success: Whether the read succeeded.
+            latency: The duration of the attempt in seconds.
+            before: The driver's ``counters()`` before the attempt.
+            after: The driver's ``counters()`` after the attempt.
+        """
+        stats = self.meters.setdefault(meter.pk, MeterStats(meter))
+        bytes_sent, bytes_received, timeouts = (a - b for a, b in zip(after, before))
+        stats.attempts += 1
+        stats.timeouts += timeouts
+        stats.bytes += bytes_sent + bytes_received
+        stats.latency = latency
+        stats.saved = success
+        self.busy_time += latency
+
+    def finish(self):
+        self.duration = perf_counter() - self._started
+        self.finished = datetime.today()
+
+
+def save_telemetry(cycle):
+    """Saves the telemetry of a cycle and drops telemetry older than ``RETENTION``."""
+    polling_cycle = PollingCycle.objects.create(
+        query_time=cycle.query_time,
+        duration=cycle.duration,
+        readings=len(cycle.readings)
+    )
+    BusCycle.objects.bulk_create(
+        BusCycle(cycle=polling_cycle, port=bus.port, duration=bus.duration, busy_time=bus.busy_time,
+                 deadline_margin=(cycle.deadline - (bus.finished or cycle.deadline)).total_seconds())
+        for bus in cycle.buses
+    )
+    MeterPoll.objects.bulk_create(
+        MeterPoll(cycle=polling_cycle, meter_id=stats.meter.pk, latency=stats.latency, attempts=stats.attempts,
+                  timeouts=stats.timeouts, bytes=stats.bytes, saved=stats.saved)
+        for bus in cycle.buses for stats in bus.meters.values()
+    )
+    PollingCycle.objects.filter(query_time__lt=cycle.query_time - RETENTION).delete()
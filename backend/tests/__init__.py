@@ -1,2 +1,9 @@
 import backend.tests.test_serial
 import backend.tests.test_eastronSDM630
+import backend.tests.test_retry
+import backend.tests.test_aiomodbus
+import backend.tests.test_simulator
+import backend.tests.test_sampling
+import backend.tests.test_telemetry
+import backend.tests.test_journal
+import backend.tests.test_scan
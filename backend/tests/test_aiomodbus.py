@@ -0,0 +1,50 @@
+"""
+Unittests for the asyncio driver in aiomodbus.
+Uses the responses of the dummy EastronSDM630 from :py:mod:`test_eastronSDM630`.
+"""
+import asyncio
+import unittest
+
+from backend.aiomodbus import AsyncEastronSDM630, build_request, parse_response
+from backend.tests.test_eastronSDM630 import RESPONSES
+
+
+class DummyBus:
+    """Answers requests like the dummy serial port."""
+    async def request(self, slaveaddress, functioncode, registeraddress, count):
+        request = build_request(slaveaddress, functioncode, registeraddress, count)
+        response = RESPONSES[request.decode('latin1')].encode('latin1')
+        return parse_response(response, slaveaddress, functioncode, count)
+
+
+class TestAsyncEastronSDM630(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.instrument = AsyncEastronSDM630(DummyBus(), 5)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def testReadNetworkBaudRate(self):
+        self.assertAlmostEqual(self.loop.run_until_complete(self.instrument.read_network_baud_rate()), 3)
+
+    def testReadImportValues(self):
+        expected = [80.622002, 76.311996, 2.106000, 2.204000]
+        values = self.loop.run_until_complete(self.instrument.read_import_values())
+        for value, expected_value in zip(values, expected):
+            self.assertAlmostEqual(value, expected_value, places=3)
+
+    def testReadExportValues(self):
+        expected = [63092.074219, 20137.281250, 21664.507812, 21290.285156]
+        values = self.loop.run_until_complete(self.instrument.read_export_values())
+        for value, expected_value in zip(values, expected):
+            self.assertAlmostEqual(value, expected_value, places=3)
+
+    def testBrokenResponse(self):
+        response = RESPONSES['\x05\x04\x00H\x00\x02ðY'].encode('latin1')
+        self.assertRaises(IOError, parse_response, response[:-1] + b'\x00', 5, 4, 2)
+        self.assertRaises(IOError, parse_response, response, 6, 4, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
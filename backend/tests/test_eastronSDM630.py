@@ -29,6 +29,14 @@ class TestDummyCommunication(unittest.TestCase):
     def testReadNetworkBaudRate(self):
         self.assertAlmostEqual(self.instrument.read_network_baud_rate(), 3)
 
+    # Silent interval and timeout follow the baud rate
+    def testTimingFollowsBaudRate(self):
+        self.assertAlmostEqual(self.instrument.silent_interval, 0.002, places=4)
+
+        self.instrument.set_baudrate(38400)
+        self.assertAlmostEqual(self.instrument.silent_interval, 0.00175)
+        self.assertLess(self.instrument.serial.timeout, 0.5)
+
     # Read Import and Export values
     def testReadTotalImport(self):
         self.assertAlmostEqual(self.instrument.read_total_import(), 80.622002, places=3)
@@ -54,6 +62,20 @@ class TestDummyCommunication(unittest.TestCase):
     def testReadExportL3(self):
         self.assertAlmostEqual(self.instrument.read_export_L3(), 21290.285156, places=3)
 
+    # Read Import and Export values with block requests
+    def testReadImportValues(self):
+        expected = [80.622002, 76.311996, 2.106000, 2.204000]
+        for value, expected_value in zip(self.instrument.read_import_values(), expected):
+            self.assertAlmostEqual(value, expected_value, places=3)
+
+    def testReadExportValues(self):
+        expected = [63092.074219, 20137.281250, 21664.507812, 21290.285156]
+        for value, expected_value in zip(self.instrument.read_export_values(), expected):
+            self.assertAlmostEqual(value, expected_value, places=3)
+
+    def testReadTooManyRegisters(self):
+        self.assertRaises(ValueError, self.instrument.read_input_registers, eastronSDM630.REG_SDML1Import, 41)
+
 
 """A dictionary of respones from a dummy EastronSDM630 instrument.
 The key is the message (string) sent to the serial port, and the item is the response (string)
@@ -93,5 +115,11 @@ RESPONSES['\x05\x04\x01b\x00\x02Ðm'] = '\x05\x04\x04F©A\x04J¿'
 # read_export_L3()
 RESPONSES['\x05\x04\x01d\x00\x020l'] = '\x05\x04\x04F¦T\x92ôB'
 
+# read_input_registers(REG_SDML1Import, 3): Import L1, L2 and L3 in one request
+RESPONSES['\x05\x04\x01Z\x00\x06Pc'] = '\x05\x04\x0cB\x98\x9f¾@\x06È´@\r\x0eV3û'
+
+# read_input_registers(REG_SDML1Export, 3): Export L1, L2 and L3 in one request
+RESPONSES['\x05\x04\x01`\x00\x06pn'] = '\x05\x04\x0cF\x9dR\x90F©A\x04F¦T\x92Yg'
+
 if __name__ == '__main__':
     unittest.main()
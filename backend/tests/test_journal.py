@@ -0,0 +1,60 @@
+"""
+Tests for the write-ahead journal of readings.
+"""
+import os
+import tempfile
+from datetime import datetime
+from unittest import mock
+from django.db import OperationalError
+from django.test import TestCase
+from backend.journal import Journal
+from backend.serial import Cycle
+from mmetering.models import Meter, MeterData
+
+
+class JournalTestCase(TestCase):
+    fixtures = ['mmetering_models_testdata.json']
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.journal = Journal(os.path.join(self.directory.name, 'readings.journal'))
+        self.readings = [MeterData(meter=meter, saved_time=datetime(2017, 1, 1, 0, 15), value=100.5,
+                                   value_l1=30.0, value_l2=40.0, value_l3=30.5)
+                         for meter in Meter.objects.all()]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay(self):
+        count = MeterData.objects.count()
+        self.journal.append(self.readings)
+        self.assertEqual(self.journal.pending(), len(self.readings))
+
+        self.assertEqual(self.journal.replay(batch_size=4), len(self.readings))
+        self.assertEqual(self.journal.pending(), 0)
+        self.assertEqual(MeterData.objects.count(), count + len(self.readings))
+
+    def test_replay_is_idempotent(self):
+        self.journal.append(self.readings)
+        self.journal.replay()
+        count = MeterData.objects.count()
+
+        # E.g. a crash after the INSERT, but before the batch was marked as replayed.
+        self.journal.append(self.readings)
+        self.assertEqual(self.journal.replay(), 0)
+        self.assertEqual(MeterData.objects.count(), count)
+
+    def test_cycle_survives_database_outage(self):
+        count = MeterData.objects.count()
+        cycle = Cycle(datetime(2017, 1, 1, 0, 15), journal=self.journal)
+        for reading in self.readings:
+            cycle.add_reading(reading)
+        self.assertEqual(self.journal.pending(), len(self.readings))
+
+        with mock.patch('backend.serial.invalidate_ports', side_effect=OperationalError):
+            self.assertRaises(OperationalError, cycle.save)
+        self.assertEqual(self.journal.pending(), len(self.readings))
+
+        cycle.save()
+        self.assertEqual(self.journal.pending(), 0)
+        self.assertEqual(MeterData.objects.count(), count + len(self.readings))
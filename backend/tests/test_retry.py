@@ -0,0 +1,61 @@
+"""
+Unittests for the retry scheduling of a polling cycle.
+"""
+import unittest
+from datetime import datetime, timedelta
+
+from backend.retry import RetryQueue, Quarantine, MAX_RETRY, QUARANTINE_AFTER
+
+
+class DummyMeter:
+    def __init__(self, pk):
+        self.pk = pk
+
+
+class TestRetryQueue(unittest.TestCase):
+    def setUp(self):
+        self.failing = DummyMeter(1)
+        self.healthy = DummyMeter(2)
+
+    def testRetriesAfterOtherMeters(self):
+        reads = RetryQueue(datetime.today() + timedelta(seconds=10))
+        reads.push(self.failing)
+        reads.push(self.healthy)
+
+        order = []
+        for meter, attempt in reads:
+            order.append((meter.pk, attempt))
+            if meter is self.failing:
+                reads.retry(meter, attempt)
+
+        expected = [(1, 0), (2, 0)] + [(1, attempt) for attempt in range(1, MAX_RETRY + 1)]
+        self.assertListEqual(order, expected)
+
+    def testNoReadsAfterDeadline(self):
+        reads = RetryQueue(datetime.today() - timedelta(seconds=1))
+
+        self.assertFalse(reads.push(self.healthy))
+        self.assertListEqual(list(reads), [])
+
+
+class TestQuarantine(unittest.TestCase):
+    def testQuarantineAfterFailedCycles(self):
+        quarantine = Quarantine()
+        meter = DummyMeter(1)
+        query_time = datetime(2017, 2, 4, 8, 0)
+
+        for i in range(QUARANTINE_AFTER):
+            self.assertFalse(quarantine.is_quarantined(meter))
+            quarantine.failed(meter, query_time)
+
+        self.assertTrue(quarantine.is_quarantined(meter))
+        self.assertFalse(quarantine.is_due(meter, query_time + timedelta(minutes=15)))
+        self.assertTrue(quarantine.is_due(meter, query_time + timedelta(minutes=30)))
+
+        quarantine.succeeded(meter)
+        self.assertFalse(quarantine.is_quarantined(meter))
+        self.assertTrue(quarantine.is_due(meter, query_time))
+
+
+if __name__ == '__main__':
+    unittest.main()
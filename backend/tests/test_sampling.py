@@ -0,0 +1,28 @@
+"""
+Unittests for the ring buffers of the power sampling.
+"""
+import unittest
+
+from backend.sampling import RingBuffer
+
+
+class TestRingBuffer(unittest.TestCase):
+    def testOverwritesOldestSample(self):
+        buffer = RingBuffer(3)
+        for second in range(5):
+            buffer.append(float(second), second * 10.0)
+
+        self.assertEqual(len(buffer), 3)
+        self.assertListEqual(sorted(buffer.between(0.0, 10.0)), [20.0, 30.0, 40.0])
+
+    def testAggregate(self):
+        buffer = RingBuffer(10)
+        for second, value in ((0, 100.0), (5, 300.0), (10, 200.0), (60, 1000.0)):
+            buffer.append(float(second), value)
+
+        self.assertTupleEqual(buffer.aggregate(0.0, 60.0), (100.0, 300.0, 200.0))
+        self.assertIsNone(buffer.aggregate(120.0, 180.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""
+Tests for saving the meters found by an address scan.
+"""
+from datetime import datetime
+from django.test import TestCase
+from backend.models import MeterPort
+from backend.scan import save_scanned_meters
+from mmetering.models import Flat, Meter
+
+
+class SaveScannedMetersTestCase(TestCase):
+    def setUp(self):
+        self.meter = Meter.objects.create(flat=Flat.objects.create(name='A', modus='IM'), addresse=1,
+                                          seriennummer='1001', active=True)
+        MeterPort.objects.create(meter=self.meter, port='/dev/ttyUSB0', verified_time=datetime(2017, 1, 1))
+
+    def testSameAddressOnTwoPorts(self):
+        created, updated = save_scanned_meters({'/dev/ttyUSB0': {1: 1001}, '/dev/ttyUSB1': {1: 2001}})
+
+        self.assertListEqual(updated, [])
+        self.assertListEqual([(meter.addresse, meter.seriennummer) for meter in created], [(1, '2001')])
+        self.meter.refresh_from_db()
+        self.assertEqual(self.meter.seriennummer, '1001')
+        self.assertEqual(MeterPort.objects.get(meter=self.meter).port, '/dev/ttyUSB0')
+        self.assertEqual(MeterPort.objects.get(meter=created[0]).port, '/dev/ttyUSB1')
+
+    def testReplacedMeterOnSamePort(self):
+        created, updated = save_scanned_meters({'/dev/ttyUSB0': {1: 1002}, '/dev/ttyUSB1': {1: 2001}})
+
+        self.assertListEqual([meter.pk for meter in updated], [self.meter.pk])
+        self.assertEqual(len(created), 1)
+        self.meter.refresh_from_db()
+        self.assertEqual(self.meter.seriennummer, '1002')
+        self.assertEqual(MeterPort.objects.get(meter=self.meter).port, '/dev/ttyUSB0')
+
+    def testOrphanedFlatOfEarlierScan(self):
+        orphan = Flat.objects.create(name='Zähler 1 an /dev/ttyUSB1', modus='IM')
+        created, updated = save_scanned_meters({'/dev/ttyUSB1': {1: 2001}})
+
+        self.assertNotEqual(created[0].flat_id, orphan.pk)
+        self.assertEqual(created[0].flat.name, orphan.name)
+        self.assertFalse(Meter.objects.filter(flat=orphan).exists())
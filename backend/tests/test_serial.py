@@ -1,5 +1,9 @@
+from unittest import mock
 from django.test import TestCase
+from backend.models import PlanVersion
+from backend.plan import get_plan, refresh_plan
 from backend.tasks import save_meter_data_task
+from backend.topology import invalidate_ports, map_meters_to_ports
 from mmetering.models import Flat, Meter
 
 
@@ -21,3 +25,53 @@ class SerialTestCase(TestCase):
     def test_data(self):
         self.assertEqual(Flat.objects.count(), 6)
         self.assertEqual(Meter.objects.count(), 6)
+
+    def test_map_meters_to_ports(self):
+        meters = list(Meter.objects.order_by('addresse'))
+        answering = {
+            '/dev/ttyUSB0': {1, 2, 3},
+            '/dev/ttyUSB1': {3, 4, 5},
+            '/dev/ttyUSB2': set(),
+        }
+
+        with mock.patch('backend.topology.probe_port', side_effect=lambda port, *_: answering[port]):
+            buses, unreachable = map_meters_to_ports(sorted(answering), meters)
+
+        self.assertListEqual([m.addresse for m in buses['/dev/ttyUSB0']], [1, 2, 3])
+        self.assertListEqual([m.addresse for m in buses['/dev/ttyUSB1']], [4, 5])
+        self.assertNotIn('/dev/ttyUSB2', buses)
+        self.assertListEqual([m.addresse for m in unreachable], [6])
+
+    def test_plan_invalidation(self):
+        plan = get_plan()
+        self.assertIs(get_plan(), plan)
+        self.assertEqual(len(plan.active_meters()), Meter.objects.filter(active=True).count())
+
+        with self.assertNumQueries(0):
+            get_plan()
+
+        meter = Meter.objects.first()
+        meter.active = False
+        meter.save()
+        self.assertIsNot(get_plan(), plan)
+        self.assertNotIn(meter.pk, [m.pk for m in get_plan().active_meters()])
+
+    def test_plan_changed_by_other_process(self):
+        plan = get_plan()
+        # Another process changed the configuration, no signal reached this one.
+        PlanVersion.objects.update_or_create(pk=1, defaults={'version': plan.version + 1})
+        with self.assertNumQueries(0):
+            self.assertIs(get_plan(), plan)
+
+        refresh_plan()
+        self.assertIsNot(get_plan(), plan)
+        self.assertEqual(get_plan().version, plan.version + 1)
+
+    def test_plan_keeps_ports_of_cycle(self):
+        plan = get_plan()
+        meters = plan.active_meters()
+        plan.update_ports({'/dev/ttyUSB0': meters[:2]}, meters[2:])
+        invalidate_ports(meters)
+        self.assertIs(get_plan(), plan)
+        self.assertListEqual([plan.ports.get(meter.pk) for meter in meters],
+                             ['/dev/ttyUSB0'] * 2 + [None] * (len(meters) - 2))
@@ -0,0 +1,53 @@
+"""
+Unittests for the simulated SDM630 bus, read with the real EastronSDM630 driver.
+"""
+import unittest
+
+from serial.serialposix import Serial
+
+import backend.eastronSDM630 as eastronSDM630
+from backend.simulator import SimulatedBus
+
+
+class TestSimulatedBus(unittest.TestCase):
+    def setUp(self):
+        # Undo the dummy serial port of the other tests
+        eastronSDM630.minimalmodbus.serial.Serial = Serial
+
+        self.bus = SimulatedBus([1, 2])
+        self.bus.start()
+
+    def tearDown(self):
+        self.bus.stop()
+
+    def testReadImportValues(self):
+        instrument = eastronSDM630.EastronSDM630(self.bus.port, 2)
+        total, value_l1, value_l2, value_l3 = instrument.read_import_values()
+
+        self.assertAlmostEqual(value_l1, 200.0, places=0)
+        self.assertGreaterEqual(total, value_l1 + value_l2 + value_l3 - 0.5)
+
+    def testReadPowerQualityValues(self):
+        instrument = eastronSDM630.EastronSDM630(self.bus.port, 1)
+        values = instrument.read_power_quality_values()
+
+        self.assertAlmostEqual(values['current_l2'], 5.0)
+        self.assertAlmostEqual(values['thd_l3'], 2.0)
+        self.assertAlmostEqual(values['frequency'], 50.0)
+        self.assertEqual(self.bus.requests, 2)
+
+    def testReadSerialNumber(self):
+        instrument = eastronSDM630.EastronSDM630(self.bus.port, 2)
+        self.assertEqual(instrument.read_serial_number(), 17000002)
+
+    def testReadNetworkBaudRate(self):
+        instrument = eastronSDM630.EastronSDM630(self.bus.port, 1)
+        self.assertAlmostEqual(instrument.read_network_baud_rate(), 3)
+
+    def testUnknownAddressIsNotReachable(self):
+        self.assertTrue(eastronSDM630.EastronSDM630(self.bus.port, 1).is_reachable())
+        self.assertFalse(eastronSDM630.EastronSDM630(self.bus.port, 3).is_reachable())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+"""
+Unittests for the polling telemetry.
+"""
+import unittest
+
+from backend.telemetry import BusStats
+
+
+class DummyMeter:
+    def __init__(self, pk):
+        self.pk = pk
+
+
+class TestBusStats(unittest.TestCase):
+    def test_record_attempts(self):
+        stats = BusStats('/dev/ttyUSB0')
+        meter = DummyMeter(1)
+        stats.record(meter, False, 0.5, (0, 0, 0), (16, 0, 2))
+        stats.record(meter, True, 0.25, (16, 0, 2), (32, 26, 2))
+        stats.finish()
+
+        meter_stats = stats.meters[1]
+        self.assertEqual(meter_stats.attempts, 2)
+        self.assertEqual(meter_stats.timeouts, 2)
+        self.assertEqual(meter_stats.bytes, 58)
+        self.assertEqual(meter_stats.latency, 0.25)
+        self.assertTrue(meter_stats.saved)
+        self.assertEqual(stats.busy_time, 0.75)
+        self.assertIsNotNone(stats.finished)
@@ -0,0 +1,167 @@
+"""
+Persisted mapping of meters to the serial ports (buses) they are connected to.
+
+Probing every tty for every meter is slow, since each unanswered request
+waits for the serial timeout. The ports found are therefore stored in the
+database and only probed again if a meter stops answering or if the entry
+has not been verified within ``TTL``.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from django.db import DatabaseError
+from serial.serialutil import SerialException
+from backend.eastronSDM630 import EastronSDM630, DEFAULT_BAUDRATE
+from backend.models import Bus, MeterPort
+from mmetering_server.settings.defaults import MODBUS_PORT
+import serial.tools.list_ports
+import logging
+
+logger = logging.getLogger(__name__)
+TTL = timedelta(hours=24)
+PORTS_LIST = [port for port, desc, hwid in serial.tools.list_ports.grep('tty')]
+
+if MODBUS_PORT in PORTS_LIST:
+    # Move manually configured port to the front in
+    # order to test this one first.
+    PORTS_LIST.remove(MODBUS_PORT)
+    PORTS_LIST.insert(0, MODBUS_PORT)
+
+
+def get_buses(ports, meters, probe=True, cached=None, baudrates=None):
+    """Maps meters to ports, probing only for meters without a valid cached port.
+
+    The ports found are stored for the next cycles. If the database is not
+    available, they are used for this cycle only.
+
+    Args:
+        ports: A list of serial port names.
+        meters: A list of Meter objects.
+        probe: If False, meters without a valid cached port are not probed
+            for but returned as not found.
+        cached: A dictionary mapping meter pks to their verified ports,
+            queried from the database if not given.
+        baudrates: A dictionary mapping ports to their baud rates, queried
+            from the database if not given.
+
+    Returns:
+        A tuple of a dictionary mapping each port to its meters and a list of
+        meters which could not be found on any port.
+    """
+    if cached is None:
+        cached = dict(MeterPort.objects
+                      .filter(meter__in=meters, verified_time__gte=datetime.today() - TTL)
+                      .values_list('meter_id', 'port'))
+
+    buses = dict()
+    unknown = []
+    for meter in meters:
+        if cached.get(meter.pk) in ports:
+            buses.setdefault(cached[meter.pk], []).append(meter)
+        else:
+            unknown.append(meter)
+
+    if not unknown or not probe:
+        return buses, unknown
+
+    found, unreachable = map_meters_to_ports(ports, unknown, baudrates)
+    for port, bus_meters in found.items():
+        try:
+            save_ports(port, bus_meters)
+        except DatabaseError:
+            logger.exception('%s: Could not save the port of the meters found on %s' % (datetime.today(), port))
+        buses.setdefault(port, []).extend(bus_meters)
+
+    return buses, unreachable
+
+
+def rescan(ports, meters):
+    """Drops the cached ports of the given meters and probes all ports for them.
+
+    Returns:
+        The same tuple as ``get_buses``.
+    """
+    invalidate_ports(meters)
+    return get_buses(ports, meters)
+
+
+def save_ports(port, meters):
+    """Stores ``port`` as the verified port of the given meters."""
+    now = datetime.today()
+    for meter in meters:
+        MeterPort.objects.update_or_create(meter=meter, defaults={'port': port, 'verified_time': now})
+
+
+def verify_ports(port, meters):
+    """Marks the cached port of meters which answered on ``port`` as verified."""
+    if meters:
+        MeterPort.objects.filter(port=port, meter__in=meters).update(verified_time=datetime.today())
+
+
+def invalidate_ports(meters):
+    """Drops the cached port of meters which did not answer anymore."""
+    if meters:
+        MeterPort.objects.filter(meter__in=meters).delete()
+
+
+def get_baudrate(port):
+    """Returns the baud rate the meters on ``port`` are configured with."""
+    baudrate = Bus.objects.filter(port=port).values_list('baudrate', flat=True).first()
+    return DEFAULT_BAUDRATE if baudrate is None else baudrate
+
+
+def set_baudrate(port, baudrate):
+    Bus.objects.update_or_create(port=port, defaults={'baudrate': baudrate})
+
+
+def map_meters_to_ports(ports, meters, baudrates=None):
+    """Probes every port in its own worker thread for the given meters.
+
+    Args:
+        ports: A list of serial port names.
+        meters: A list of Meter objects.
+        baudrates: A dictionary mapping ports to their baud rates, queried
+            from the database if not given.
+
+    Returns:
+        A tuple of a dictionary mapping each port to the meters which answered on it
+        and a list of meters which could not be found on any port. A meter answering
+        on several ports is assigned to the first one in ``ports``.
+    """
+    if not ports:
+        return dict(), list(meters)
+
+    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+        reachable = list(executor.map(lambda port: probe_port(port, meters, baudrates), ports))
+
+    buses = dict()
+    unreachable = []
+    for meter in meters:
+        for port, addresses in zip(ports, reachable):
+            if meter.addresse in addresses:
+                buses.setdefault(port, []).append(meter)
+                break
+        else:
+            unreachable.append(meter)
+
+    return buses, unreachable
+
+
+def probe_port(port, meters, baudrates=None):
+    """Checks which of the given meters answer on a port.
+
+    Returns:
+        A set of slave addresses which are reachable on ``port``.
+    """
+    addresses = set()
+    baudrate = get_baudrate(port) if baudrates is None else baudrates.get(port, DEFAULT_BAUDRATE)
+    for meter in meters:
+        try:
+            eastron = EastronSDM630(port, meter.addresse, baudrate)
+            if eastron.is_reachable():
+                addresses.add(meter.addresse)
+        except SerialException:
+            logger.error('%s: Port %s not available on meter with address %d'
+                         % (datetime.today(), port, meter.addresse))
+            break
+
+    return addresses
@@ -0,0 +1,61 @@
+"""
+Allocation of the self-produced energy (PV, BHKW) to the consumers for the monthly bill.
+
+In every quarter-hour, the output of each producer is split among the consumers
+in proportion to their consumption. If all producers together produce more than
+all consumers use, only the consumed part is allocated. Consumption and
+production are held as matrices with one row per flat and one column per
+quarter-hour slot, so that the shares of a whole month are computed with a few
+array operations instead of a loop over every flat, slot and producer.
+"""
+from itertools import chain
+import numpy as np
+
+
+def to_matrix(series, slots):
+    """Returns an array with one row per series and one column per slot, which is zero
+    where a series has no value.
+
+    Args:
+        series: A list of dictionaries like {slot: float}, or None for an empty series.
+        slots: The sorted array of all slots.
+    """
+    matrix = np.zeros((len(series), len(slots)))
+    for row, values in enumerate(series):
+        if values:
+            columns = np.searchsorted(slots, np.fromiter(values.keys(), np.int64, len(values)))
+            matrix[row, columns] = np.fromiter(values.values(), np.float64, len(values))
+
+    return matrix
+
+
+def allocate_production(consumption, production):
+    """Splits the production of every producer among the consumers.
+
+    Args:
+        consumption: A dictionary containing the consumption values of each import
+            flat like {pk: {slot: float}}.
+        production: A dictionary containing the production values of each export
+            flat like {pk: {slot: float}}.
+
+    Returns:
+        A dictionary containing the share of each producer in the consumption of
+        each import flat like {pk: {producer pk: float}}.
+    """
+    flats = list(consumption)
+    producers = list(production)
+    series = [consumption[pk] for pk in flats] + [production[pk] for pk in producers]
+    slots = np.unique(np.fromiter(chain.from_iterable(values or () for values in series), np.int64))
+    matrix = to_matrix(series, slots)
+    consumed, produced = matrix[:len(flats)], matrix[len(flats):]
+
+    total_consumption = consumed.sum(axis=0)
+    total_production = produced.sum(axis=0)
+    # If all producers produce more than all consumers consume, the surplus is ignored.
+    surplus = total_production > total_consumption
+    scale = np.divide(total_consumption, total_production, out=np.ones_like(total_production),
+                      where=surplus & (total_production != 0))
+    ratio = np.divide(consumed, total_consumption, out=np.zeros_like(consumed), where=total_consumption != 0)
+
+    shares = ratio @ (produced * scale).T
+    return {pk: dict(zip(producers, shares[row].tolist())) for row, pk in enumerate(flats)}
@@ -0,0 +1,127 @@
+"""
+Columnar copy of the meter data for analytical reads.
+
+Every meter has a directory with one file per column: the quarter-hour
+slots of its readings as int64 (see ``mmetering.slots``) and the values as float64,
+all in ascending order of the slots. The files are plain arrays without a
+header, so that they can be appended to and memory-mapped as NumPy arrays::
+
+    archive = ColumnarArchive()
+    for meter_id, columns in archive.scan(datetime(2017, 1, 1), datetime(2018, 1, 1)):
+        consumption = columns['value'][-1] - columns['value'][0]
+
+Reading a timespan only maps the files and returns views on them, without
+copying or creating model instances.
+"""
+import os
+import numpy as np
+from django.conf import settings
+from mmetering.models import MeterData
+from mmetering.slots import from_slot, to_slot
+
+COLUMNS = ('value', 'value_l1', 'value_l2', 'value_l3')
+DTYPES = dict({'slot': np.int64}, **{column: np.float64 for column in COLUMNS})
+BATCH_SIZE = 10000
+
+
+class ColumnarArchive:
+    """Reads and appends the columnar files of all meters.
+
+    Args:
+        directory (str): The directory holding one subdirectory per meter,
+            defaults to the COLUMNAR_ARCHIVE setting.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory or settings.COLUMNAR_ARCHIVE
+
+    def path(self, meter_id, column):
+        return os.path.join(self.directory, str(meter_id), '%s.bin' % column)
+
+    def meters(self):
+        """Returns the pks of all meters in the archive."""
+        if not os.path.isdir(self.directory):
+            return []
+
+        return sorted(int(name) for name in os.listdir(self.directory) if name.isdigit())
+
+    def _map(self, meter_id, column, length=None):
+        path = self.path(meter_id, column)
+        size = os.path.getsize(path) // np.dtype(DTYPES[column]).itemsize if os.path.exists(path) else 0
+        if length is not None:
+            size = min(size, length)
+        if not size:
+            return np.empty(0, dtype=DTYPES[column])
+
+        return np.memmap(path, dtype=DTYPES[column], mode='r', shape=(size,))
+
+    def read(self, meter_id, start=None, end=None):
+        """Maps the columns of a meter, optionally only from ``start`` until before ``end``.
+
+        Returns:
+            A dictionary of read-only NumPy arrays with the keys 'slot', 'value'
+            and 'value_l1' to 'value_l3'. The arrays are views on the mapped
+            files, missing values are NaN.
+        """
+        slots = self._map(meter_id, 'slot')
+        first = 0 if start is None else np.searchsorted(slots, to_slot(start))
+        last = len(slots) if end is None else np.searchsorted(slots, to_slot(end))
+
+        columns = {'slot': slots[first:last]}
+        for column in COLUMNS:
+            # Columns may be longer than the slots after an interrupted append.
+            columns[column] = self._map(meter_id, column, len(slots))[first:last]
+
+        return columns
+
+    def scan(self, start=None, end=None):
+        """Yields pairs of meter pk and ``read`` result for all meters."""
+        for meter_id in self.meters():
+            yield meter_id, self.read(meter_id, start, end)
+
+    def append(self, meter_id, rebuild=False):
+        """Appends the readings of a meter which are newer than its last slot in the archive.
+
+        Args:
+            meter_id: The pk of the meter.
+            rebuild: Whether to drop the files and write all readings again,
+                e.g. after readings have been inserted in the past.
+
+        Returns:
+            The number of appended readings.
+        """
+        os.makedirs(os.path.join(self.directory, str(meter_id)), exist_ok=True)
+        if rebuild:
+            for column in DTYPES:
+                if os.path.exists(self.path(meter_id, column)):
+                    os.remove(self.path(meter_id, column))
+
+        slots = self._map(meter_id, 'slot')
+        count = len(slots)
+        data = MeterData.objects.filter(meter_id=meter_id).order_by('saved_time')
+        if count:
+            data = data.filter(saved_time__gte=from_slot(slots[-1] + 1))
+        del slots
+
+        # Cut off the remains of an interrupted append.
+        for column in COLUMNS:
+            path = self.path(meter_id, column)
+            if os.path.exists(path):
+                os.truncate(path, count * np.dtype(DTYPES[column]).itemsize)
+
+        appended = 0
+        rows = data.values_list('saved_time', *COLUMNS).iterator()
+        while True:
+            batch = [row for _, row in zip(range(BATCH_SIZE), rows)]
+            if not batch:
+                break
+
+            values = np.array([row[1:] for row in batch], dtype=np.float64)
+            for index, column in enumerate(COLUMNS):
+                with open(self.path(meter_id, column), 'ab') as f:
+                    values[:, index].tofile(f)
+            # The slots come last, they define which values are complete.
+            with open(self.path(meter_id, 'slot'), 'ab') as f:
+                np.array([to_slot(row[0]) for row in batch], dtype=np.int64).tofile(f)
+            appended += len(batch)
+
+        return appended
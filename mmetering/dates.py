@@ -0,0 +1,11 @@
+"""
+Calendar helpers shared by the summaries and the data maintenance.
+"""
+from datetime import datetime, timedelta
+
+
+def month_range(month):
+    """Returns the start of the month containing ``month`` and the start of the following
+    month, for range lookups which can use the (meter, saved_time) index."""
+    start = datetime(month.year, month.month, 1)
+    return start, (start + timedelta(days=32)).replace(day=1)
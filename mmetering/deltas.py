@@ -0,0 +1,137 @@
+"""
+Consumption of every reading since the previous reading of the same meter.
+
+The deltas are computed when the readings are inserted, so that consumption
+queries sum up ``delta`` instead of differencing consecutive counter values.
+Counter resets and gaps in the readings are flagged in ``delta_status``.
+"""
+from django.db.models import Case, FloatField, IntegerField, Max, Value, When
+from mmetering.models import MeterData
+
+# A reading more than this after the previous one marks a gap.
+MAX_INTERVAL = MeterData.INTERVAL * 1.5
+BATCH_SIZE = 500
+
+
+def calculate_delta(previous, saved_time, value):
+    """Returns the tuple (delta, delta_status) of a reading.
+
+    Args:
+        previous: A tuple (saved_time, value) of the previous reading of the meter, or None.
+        saved_time: The time of the reading.
+        value: The counter value of the reading.
+    """
+    if previous is None:
+        return None, MeterData.DELTA_FIRST
+
+    previous_time, previous_value = previous
+    if value < previous_value:
+        return value, MeterData.DELTA_RESET
+    if saved_time - previous_time > MAX_INTERVAL:
+        return value - previous_value, MeterData.DELTA_GAP
+
+    return value - previous_value, MeterData.DELTA_OK
+
+
+def get_previous(meter_ids, before):
+    """Returns a dictionary mapping each meter to the tuple (saved_time, value)
+    of its latest reading before ``before``, or of its latest reading at all if it is None."""
+    readings = MeterData.objects.filter(meter_id__in=meter_ids)
+    if before is not None:
+        readings = readings.filter(saved_time__lt=before)
+    latest = dict(readings
+                  .values('meter_id')
+                  .annotate(last=Max('saved_time'))
+                  .values_list('meter_id', 'last'))
+    if not latest:
+        return dict()
+
+    rows = MeterData.objects \
+        .filter(meter_id__in=latest.keys(), saved_time__in=set(latest.values())) \
+        .values_list('meter_id', 'saved_time', 'value')
+    return {meter_id: (saved_time, value) for meter_id, saved_time, value in rows
+            if latest[meter_id] == saved_time}
+
+
+def set_deltas(readings):
+    """Sets delta and delta_status of unsaved readings.
+
+    Returns:
+        A tuple of the meters which already have later readings in the database,
+        whose deltas have to be recomputed with ``recompute_deltas`` after inserting,
+        and the time to recompute from.
+    """
+    if not readings:
+        return set(), None
+
+    meter_ids = {reading.meter_id for reading in readings}
+    since = min(reading.saved_time for reading in readings)
+    previous = get_previous(meter_ids, since)
+    for reading in sorted(readings, key=lambda reading: (reading.meter_id, reading.saved_time)):
+        reading.delta, reading.delta_status = calculate_delta(previous.get(reading.meter_id),
+                                                              reading.saved_time, reading.value)
+        previous[reading.meter_id] = (reading.saved_time, reading.value)
+
+    late = set(MeterData.objects
+               .filter(meter_id__in=meter_ids, saved_time__gte=since)
+               .values_list('meter_id', flat=True)
+               .distinct())
+    return late, since
+
+
+def recompute_deltas(meter_ids, since=None):
+    """Recomputes the deltas of saved readings, e.g. after readings have been
+    inserted out of order or to fill in the deltas of existing data.
+
+    Args:
+        meter_ids: The pks of the meters.
+        since (datetime): Only recompute the readings from this time on.
+
+    Returns:
+        The number of updated readings.
+    """
+    updated = 0
+    for meter_id in meter_ids:
+        previous = get_previous([meter_id], since).get(meter_id) if since is not None else None
+        rows = MeterData.objects.filter(meter_id=meter_id).order_by('saved_time')
+        if since is not None:
+            rows = rows.filter(saved_time__gte=since)
+
+        changes = dict()
+        for pk, saved_time, value, delta, delta_status in \
+                rows.values_list('pk', 'saved_time', 'value', 'delta', 'delta_status').iterator():
+            if delta_status == MeterData.DELTA_HOURLY:
+                # Compacted readings keep the consumption of the whole hour.
+                previous = (saved_time, value)
+                continue
+
+            change = calculate_delta(previous, saved_time, value)
+            if change != (delta, delta_status):
+                changes[pk] = change
+            previous = (saved_time, value)
+
+            if len(changes) >= BATCH_SIZE:
+                updated += save_deltas(changes)
+                changes = dict()
+
+        updated += save_deltas(changes)
+
+    return updated
+
+
+def save_deltas(changes):
+    """Updates the deltas of a batch of readings with one UPDATE.
+
+    Args:
+        changes: A dictionary mapping pks to tuples (delta, delta_status).
+    """
+    if not changes:
+        return 0
+
+    MeterData.objects.filter(pk__in=changes.keys()).update(
+        delta=Case(*[When(pk=pk, then=Value(delta)) for pk, (delta, status) in changes.items()],
+                   output_field=FloatField()),
+        delta_status=Case(*[When(pk=pk, then=Value(status)) for pk, (delta, status) in changes.items()],
+                          output_field=IntegerField())
+    )
+    return len(changes)
@@ -0,0 +1,203 @@
+"""
+Bulk import of historical readings, e.g. from the loggers of a building moving to mmetering.
+
+Files of readings are streamed through a pipeline of generators: the rows are
+read one at a time, validated, their timestamps are quantized to the
+quarter-hour and the resulting MeterData objects are written in chunks of
+fixed size. Memory use does not grow with the size of the file. Readings which
+are already in MeterData are skipped, so an interrupted import can be re-run.
+
+Accepted formats are CSV with a header row and newline-delimited JSON, optionally
+gzip compressed, with the fields::
+
+    meter, saved_time, value, value_l1, value_l2, value_l3
+
+where ``meter`` is the serial number or the address of the meter.
+"""
+import csv
+import gzip
+import json
+import logging
+import math
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from dateutil import parser as dateparser
+from django.db import transaction
+from mmetering.deltas import recompute_deltas
+from mmetering.latest import update_latest
+from mmetering.models import Meter, MeterData
+from mmetering.rollups import update_rollups
+from mmetering.slots import set_slots
+
+logger = logging.getLogger(__name__)
+CHUNK_SIZE = 10000
+VALUE_FIELDS = ('value', 'value_l1', 'value_l2', 'value_l3')
+
+
+class InvalidReading(ValueError):
+    """A row which can not be imported."""
+
+
+def open_file(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='')
+
+    return open(path, newline='')
+
+
+def read_rows(path, file_format=None):
+    """Yields the rows of a CSV or NDJSON file as dictionaries.
+
+    Args:
+        path (str): The file, compressed files have to end with ``.gz``.
+        file_format (str): 'csv' or 'ndjson', guessed from the file name if not given.
+    """
+    if file_format is None:
+        file_format = 'ndjson' if path.replace('.gz', '').endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+    with open_file(path) as lines:
+        if file_format == 'csv':
+            yield from csv.DictReader(lines)
+        else:
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def quantize(saved_time):
+    """Rounds a point in time to the nearest quarter-hour."""
+    quarter_hours = round((saved_time.minute * 60 + saved_time.second + saved_time.microsecond / 1e6) / 900)
+    return saved_time.replace(minute=0, second=0, microsecond=0) + quarter_hours * MeterData.INTERVAL
+
+
+def parse_time(text):
+    """Parses an ISO 8601 timestamp, or any other format understood by dateutil.
+    Timestamps with a time zone are converted to local time."""
+    try:
+        return datetime.strptime(text.replace('T', ' '), '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        saved_time = dateparser.parse(text)
+
+    if saved_time.tzinfo is not None:
+        saved_time = saved_time.astimezone().replace(tzinfo=None)
+    return saved_time
+
+
+def parse_value(text, required):
+    if text is None or text == '':
+        if required:
+            raise InvalidReading('missing value')
+        return None
+
+    value = float(text)
+    if not math.isfinite(value) or value < 0:
+        raise InvalidReading('invalid value %r' % text)
+    return value
+
+
+def parse_readings(rows, meters, stats):
+    """Turns rows into unsaved MeterData objects, skipping invalid rows.
+
+    Args:
+        rows: An iterable of dictionaries as yielded by ``read_rows``.
+        meters: A dictionary mapping the ``meter`` field to the primary key of the meter.
+        stats (Counter): Counts the rejected rows under 'invalid'.
+    """
+    for line, row in enumerate(rows, 1):
+        try:
+            meter_id = meters.get(str(row.get('meter')).strip())
+            if meter_id is None:
+                raise InvalidReading('unknown meter %r' % row.get('meter'))
+
+            yield MeterData(
+                meter_id=meter_id,
+                saved_time=quantize(parse_time(str(row['saved_time']))),
+                **{field: parse_value(row.get(field), field == 'value') for field in VALUE_FIELDS}
+            )
+        except (InvalidReading, KeyError, TypeError, ValueError, OverflowError) as error:
+            stats['invalid'] += 1
+            logger.warning('Skipping row %d: %s' % (line, error))
+
+
+def chunked(iterable, size):
+    """Yields lists of up to ``size`` items of ``iterable``."""
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def save_chunk(readings):
+    """Inserts the readings which are neither in MeterData nor duplicates of an earlier one in the chunk,
+    and merges them into the rollups in the same transaction.
+
+    Returns:
+        The inserted readings.
+    """
+    unique = dict()
+    spans = dict()
+    for reading in readings:
+        unique.setdefault((reading.meter_id, reading.saved_time), reading)
+        first, last = spans.get(reading.meter_id, (reading.saved_time, reading.saved_time))
+        spans[reading.meter_id] = (min(first, reading.saved_time), max(last, reading.saved_time))
+
+    with transaction.atomic():
+        # One query per meter over its own timespan, so that a chunk spanning several
+        # meters does not load the values of all of them over the timespan of the chunk.
+        existing = set()
+        for meter_id, span in spans.items():
+            existing.update(MeterData.objects
+                            .filter(meter_id=meter_id, saved_time__range=span)
+                            .values_list('meter_id', 'saved_time')
+                            .iterator())
+        new = [reading for key, reading in unique.items() if key not in existing]
+        set_slots(new)
+        MeterData.objects.bulk_create(new)
+        update_rollups(new)
+
+    return new
+
+
+def import_readings(paths, key='serial', file_format=None, chunk_size=CHUNK_SIZE):
+    """Imports files of readings.
+
+    The rollups are updated with every chunk. The deltas and latest readings are
+    not maintained per chunk, but updated once for the imported timespan of each
+    meter at the end.
+
+    Args:
+        paths: The files to import.
+        key (str): 'serial' if the ``meter`` field holds serial numbers, 'address' for addresses.
+        file_format (str): 'csv' or 'ndjson', guessed from the file names if not given.
+        chunk_size (int): The number of readings inserted at once.
+
+    Returns:
+        A Counter of the 'imported' rows, the rows 'skipped' as already imported
+        or duplicate and the 'invalid' rows.
+    """
+    field = 'seriennummer' if key == 'serial' else 'addresse'
+    meters = {str(value): pk for pk, value in Meter.objects.values_list('pk', field)}
+    stats = Counter()
+    since = dict()
+    newest = dict()
+
+    for path in paths:
+        for chunk in chunked(parse_readings(read_rows(path, file_format), meters, stats), chunk_size):
+            new = save_chunk(chunk)
+            stats['imported'] += len(new)
+            stats['skipped'] += len(chunk) - len(new)
+            # Also for skipped readings, so that a re-run completes an interrupted import.
+            for reading in chunk:
+                if reading.meter_id not in since or reading.saved_time < since[reading.meter_id]:
+                    since[reading.meter_id] = reading.saved_time
+                if reading.meter_id not in newest or reading.saved_time > newest[reading.meter_id].saved_time:
+                    newest[reading.meter_id] = reading
+
+    for meter_id, saved_time in since.items():
+        recompute_deltas([meter_id], saved_time)
+    with transaction.atomic():
+        update_latest(newest.values())
+
+    return stats
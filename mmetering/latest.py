@@ -0,0 +1,80 @@
+"""
+The latest reading of every meter.
+
+LatestMeterData holds one row per meter which is updated with each batch of
+readings written to MeterData, so that the current totals read one row per
+meter instead of searching the history of each meter.
+"""
+from django.db import transaction
+from mmetering.deltas import get_previous
+from mmetering.models import LatestMeterData, Meter
+
+
+def update_latest(readings):
+    """Replaces the latest reading of each meter by newer ones among the saved MeterData objects.
+    Has to be called within the transaction saving the readings."""
+    newest = dict()
+    for reading in readings:
+        if reading.meter_id not in newest or reading.saved_time > newest[reading.meter_id].saved_time:
+            newest[reading.meter_id] = reading
+    if not newest:
+        return
+
+    with transaction.atomic():
+        rows = {row.meter_id: row for row in LatestMeterData.objects.select_for_update()
+                .filter(meter_id__in=newest.keys())}
+        created = []
+        for meter_id, reading in newest.items():
+            row = rows.get(meter_id)
+            if row is None:
+                created.append(LatestMeterData(meter_id=meter_id, saved_time=reading.saved_time, value=reading.value))
+            elif reading.saved_time > row.saved_time:
+                row.saved_time = reading.saved_time
+                row.value = reading.value
+                row.save(update_fields=['saved_time', 'value'])
+
+        LatestMeterData.objects.bulk_create(created)
+
+
+def get_latest_values(meter_ids, until=None):
+    """Returns the value of the latest reading of each meter before ``until``.
+
+    Meters whose latest reading is before ``until`` are answered from LatestMeterData.
+    All others, and meters missing there, are looked up in MeterData with one grouped
+    query, so the number of queries does not depend on the number of meters.
+
+    Args:
+        meter_ids: The primary keys of the meters.
+        until (datetime): Only readings before this point in time are considered,
+            defaults to all readings.
+
+    Returns:
+        A dictionary mapping each meter with readings to its value.
+    """
+    meter_ids = set(meter_ids)
+    latest = dict()
+    for meter_id, saved_time, value in LatestMeterData.objects.filter(meter_id__in=meter_ids) \
+            .values_list('meter_id', 'saved_time', 'value'):
+        if until is None or saved_time < until:
+            latest[meter_id] = value
+
+    missing = meter_ids - latest.keys()
+    if missing:
+        latest.update((meter_id, value) for meter_id, (saved_time, value) in get_previous(missing, until).items())
+
+    return latest
+
+
+def rebuild_latest():
+    """Sets the latest reading of every meter from MeterData, for data saved before it was kept.
+
+    Returns:
+        The number of meters with readings.
+    """
+    with transaction.atomic():
+        LatestMeterData.objects.all().delete()
+        rows = [LatestMeterData(meter_id=meter_id, saved_time=saved_time, value=value)
+                for meter_id, (saved_time, value) in get_previous(Meter.objects.values_list('pk', flat=True), None).items()]
+        LatestMeterData.objects.bulk_create(rows)
+
+    return len(rows)
@@ -1,5 +1,9 @@
-from django.db import models
-from datetime import datetime
+import re
+import sqlite3
+from functools import lru_cache
+from itertools import groupby
+from django.db import connections, models
+from datetime import datetime, timedelta
 
 
 class Flat(models.Model):
@@ -56,13 +60,84 @@ class Meter(models.Model):
         verbose_name_plural = "Zähler"
 
 
+@lru_cache()
+def has_window_functions(alias):
+    """Checks whether the database ``alias`` supports window functions like LAG(),
+    which MySQL only does from 8.0 and MariaDB from 10.2 on."""
+    connection = connections[alias]
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 25, 0)
+    if connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT VERSION()')
+            version = cursor.fetchone()[0]
+        numbers = tuple(int(number) for number in re.findall(r'\d+', version)[:2])
+        return numbers >= ((10, 2) if 'MariaDB' in version else (8, 0))
+
+    return connection.vendor == 'postgresql'
+
+
+class MeterDataQuerySet(models.QuerySet):
+    def consumption(self):
+        """Calculates the consumption of every reading since the previous reading of
+        the same meter within this QuerySet, with a single query.
+
+        Uses ``LAG()`` over the readings of each meter if the database supports it and
+        differences the ordered values in Python otherwise. The first reading of each
+        meter has no predecessor within the QuerySet, so its consumption is None.
+
+        Returns:
+            Tuples (meter_id, saved_time, consumption) ordered by meter and saved_time.
+        """
+        readings = self.order_by('meter_id', 'saved_time')
+        if has_window_functions(self.db):
+            connection = connections[self.db]
+            table = connection.ops.quote_name(self.model._meta.db_table)
+            column = {name: '%s.%s' % (table, connection.ops.quote_name(name))
+                      for name in ('meter_id', 'saved_time', 'value')}
+            lag = '{value} - LAG({value}) OVER (PARTITION BY {meter_id} ORDER BY {saved_time})'.format(**column)
+            return readings.extra(select={'consumption': lag}).values_list('meter_id', 'saved_time', 'consumption')
+
+        result = []
+        for meter_id, rows in groupby(readings.values_list('meter_id', 'saved_time', 'value'), lambda row: row[0]):
+            previous = None
+            for meter_id, saved_time, value in rows:
+                result.append((meter_id, saved_time, None if previous is None else value - previous))
+                previous = value
+
+        return result
+
+
 class MeterData(models.Model):
+    # Time between two readings of a meter.
+    INTERVAL = timedelta(minutes=15)
+    DELTA_OK = 0
+    DELTA_FIRST = 1  # no previous value
+    DELTA_GAP = 2  # the previous value is more than one interval older
+    DELTA_RESET = 3  # the counter has been reset, delta is the value since the reset
+    DELTA_HOURLY = 4  # compacted to the last value of the hour, see mmetering.retention
+    DELTA_STATUS = (
+        (DELTA_OK, 'OK'),
+        (DELTA_FIRST, 'Erster Wert'),
+        (DELTA_GAP, 'Lücke'),
+        (DELTA_RESET, 'Zählerrücksetzung'),
+        (DELTA_HOURLY, 'Stundenwert'),
+    )
+    # The foreign key constraint is only dropped on MySQL when the table is
+    # partitioned (see backend.partitions), deletes are still cascaded by Django.
     meter = models.ForeignKey(Meter, on_delete=models.CASCADE)
     saved_time = models.DateTimeField(db_index=True)
     value = models.FloatField()
     value_l1 = models.FloatField(null=True)
     value_l2 = models.FloatField(null=True)
     value_l3 = models.FloatField(null=True)
+    # Set at ingest, see mmetering.deltas
+    delta = models.FloatField(null=True, help_text="Verbrauch seit dem vorherigen Zählerstand")
+    delta_status = models.SmallIntegerField(null=True, choices=DELTA_STATUS)
+    # Set at ingest, see mmetering.slots
+    slot = models.IntegerField(null=True, help_text="Viertelstunde seit 1970")
+
+    objects = MeterDataQuerySet.as_manager()
 
     def __str__(self):
         return "Datenwert für " + self.meter.flat.name
@@ -71,12 +146,14 @@ class MeterData(models.Model):
         return self.meter.flat.modus
 
     def get_consumption(self, delta):
-        pre = MeterData.objects.filter(
-            meter=self.meter,
-            saved_time=self.saved_time - delta
-        ).exists()
-        if pre:
-            pre_val = MeterData.objects.get(meter=self.meter, saved_time=self.saved_time - delta).value
+        if delta == MeterData.INTERVAL and self.delta_status == MeterData.DELTA_OK:
+            return self.delta
+
+        pre_val = MeterData.objects \
+            .filter(meter_id=self.meter_id, saved_time=self.saved_time - delta) \
+            .values_list('value', flat=True) \
+            .first()
+        if pre_val is not None:
             return self.value - pre_val
         else:
             return self.value
@@ -86,6 +163,90 @@ class MeterData(models.Model):
             ("can_download", "Can download MeterData"),
             ("can_view", "Can view MeterData"),
         )
+        # Covers the lookups of a meter's values in a timespan.
+        index_together = [
+            ['meter', 'saved_time', 'value'],
+            ['meter', 'slot'],
+        ]
+
+
+class LatestMeterData(models.Model):
+    """The latest reading of each meter, kept up to date at ingest, see mmetering.latest."""
+    meter = models.OneToOneField(Meter, on_delete=models.CASCADE, primary_key=True, related_name='latest')
+    saved_time = models.DateTimeField()
+    value = models.FloatField()
+
+    def __str__(self):
+        return "Letzter Zählerstand von " + str(self.meter)
+
+
+class MeterDataRollup(models.Model):
+    """The last value of a meter within an hour, day or month."""
+    HOUR = 'H'
+    DAY = 'D'
+    MONTH = 'M'
+    RESOLUTIONS = (
+        (HOUR, 'Stunde'),
+        (DAY, 'Tag'),
+        (MONTH, 'Monat'),
+    )
+    meter = models.ForeignKey(Meter, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=1, choices=RESOLUTIONS)
+    period = models.DateTimeField(help_text="Beginn des Zeitraums")
+    saved_time = models.DateTimeField(help_text="Zeitpunkt des letzten Zählerstands im Zeitraum")
+    value = models.FloatField()
+
+    class Meta:
+        unique_together = ('meter', 'resolution', 'period')
+
+
+class ModeRollup(models.Model):
+    """The sum of the last values of all meters of a mode within an hour, day or month."""
+    modus = models.CharField(max_length=2, choices=Flat.MODE_TYPES)
+    resolution = models.CharField(max_length=1, choices=MeterDataRollup.RESOLUTIONS)
+    period = models.DateTimeField(help_text="Beginn des Zeitraums")
+    saved_time = models.DateTimeField(db_index=True, help_text="Zeitpunkt des letzten Zählerstands im Zeitraum")
+    value = models.FloatField()
+
+    class Meta:
+        unique_together = ('modus', 'resolution', 'period')
+
+
+class PowerData(models.Model):
+    """Instantaneous power of a meter, aggregated per minute."""
+    meter = models.ForeignKey(Meter, on_delete=models.CASCADE)
+    saved_time = models.DateTimeField(db_index=True, help_text="Beginn der Minute")
+    power_min = models.FloatField()
+    power_max = models.FloatField()
+    power_mean = models.FloatField()
+
+    def __str__(self):
+        return "Leistungswert für " + self.meter.flat.name
+
+
+class PowerQualityData(models.Model):
+    """Electrical quantities of a meter at a quarter-hour, one row per meter and slot."""
+    meter = models.ForeignKey(Meter, on_delete=models.CASCADE)
+    saved_time = models.DateTimeField(db_index=True)
+    voltage_l1 = models.FloatField(help_text="V")
+    voltage_l2 = models.FloatField(help_text="V")
+    voltage_l3 = models.FloatField(help_text="V")
+    current_l1 = models.FloatField(help_text="A")
+    current_l2 = models.FloatField(help_text="A")
+    current_l3 = models.FloatField(help_text="A")
+    power_l1 = models.FloatField(help_text="W")
+    power_l2 = models.FloatField(help_text="W")
+    power_l3 = models.FloatField(help_text="W")
+    thd_l1 = models.FloatField(help_text="THD der Spannung in %")
+    thd_l2 = models.FloatField(help_text="THD der Spannung in %")
+    thd_l3 = models.FloatField(help_text="THD der Spannung in %")
+    frequency = models.FloatField(help_text="Hz")
+
+    class Meta:
+        unique_together = ('meter', 'saved_time')
+
+    def __str__(self):
+        return "Netzqualität für " + self.meter.flat.name
 
 
 class Activities(models.Model):
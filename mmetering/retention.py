@@ -0,0 +1,214 @@
+"""
+Retention of the raw meter values.
+
+Whole months older than ``RETENTION_DAYS`` are compacted: all raw values of
+a meter are written to a compressed archive file per meter and month, and
+only the last value of every hour is kept in MeterData, with the consumption
+of the whole hour as its delta. Archived months can be restored for audits.
+A restored month is marked next to its archive and is not compacted again
+until it is released with ``release_month``.
+"""
+import csv
+import gzip
+import io
+import logging
+import os
+from datetime import datetime, timedelta
+from itertools import groupby
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from mmetering.dates import month_range
+from mmetering.deltas import recompute_deltas, save_deltas
+from mmetering.models import MeterData
+from mmetering.slots import set_slots
+
+logger = logging.getLogger(__name__)
+FIELDS = ('saved_time', 'value', 'value_l1', 'value_l2', 'value_l3', 'delta', 'delta_status')
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+BATCH_SIZE = 500
+
+
+def archive_path(meter_id, month, directory=None):
+    return os.path.join(directory or settings.RETENTION_ARCHIVE, str(meter_id), month.strftime('%Y-%m.csv.gz'))
+
+
+def restored_path(meter_id, month, directory=None):
+    """Returns the path of the marker of a restored month."""
+    return archive_path(meter_id, month, directory).replace('.csv.gz', '.restored')
+
+
+def to_row(meter_data):
+    return [meter_data.saved_time.strftime(TIME_FORMAT)] + \
+           ['' if getattr(meter_data, field) is None else getattr(meter_data, field) for field in FIELDS[1:]]
+
+
+def from_row(meter_id, row):
+    values = dict(zip(FIELDS, row))
+    return MeterData(
+        meter_id=meter_id,
+        saved_time=datetime.strptime(values['saved_time'], TIME_FORMAT),
+        delta_status=int(values['delta_status']) if values['delta_status'] else None,
+        **{field: float(values[field]) if values[field] else None for field in FIELDS[1:6]}
+    )
+
+
+def read_archive(meter_id, month, directory=None):
+    """Reads the archived raw values of a meter in a month.
+
+    Returns:
+        A list of unsaved MeterData objects, ordered by saved_time.
+
+    Raises:
+        FileNotFoundError: If the month has not been archived.
+    """
+    with gzip.open(archive_path(meter_id, month, directory), 'rt', newline='') as archive:
+        reader = csv.reader(archive)
+        next(reader)
+        return [from_row(meter_id, row) for row in reader]
+
+
+def write_archive(meter_id, month, readings, directory=None):
+    """Writes raw values to the archive of a meter and month, merging them with
+    values archived before. The file is replaced atomically."""
+    path = archive_path(meter_id, month, directory)
+    merged = dict()
+    if os.path.exists(path):
+        merged.update((reading.saved_time, reading) for reading in read_archive(meter_id, month, directory))
+    merged.update((reading.saved_time, reading) for reading in readings)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    writer.writerows(to_row(merged[saved_time]) for saved_time in sorted(merged))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path + '.tmp', 'wt') as archive:
+        archive.write(buffer.getvalue())
+    os.replace(path + '.tmp', path)
+
+
+def compact_hour(readings):
+    """Returns the tuple (delta, delta_status) of the last reading of an hour,
+    covering the consumption of all readings of the hour."""
+    statuses = {reading.delta_status for reading in readings}
+    deltas = [reading.delta for reading in readings if reading.delta is not None]
+    if MeterData.DELTA_RESET in statuses:
+        status = MeterData.DELTA_RESET
+    elif MeterData.DELTA_GAP in statuses:
+        status = MeterData.DELTA_GAP
+    elif statuses == {MeterData.DELTA_FIRST}:
+        status = MeterData.DELTA_FIRST
+    else:
+        status = MeterData.DELTA_HOURLY
+
+    return (sum(deltas) if deltas else None), status
+
+
+def compact_month(meter_id, month, directory=None):
+    """Archives the raw values of a meter in a month and keeps only the last value of every hour.
+
+    Returns:
+        The number of deleted values.
+    """
+    start, end = month_range(month)
+    if os.path.exists(restored_path(meter_id, start, directory)):
+        logger.info('Not compacting %s of meter %d, it has been restored' % (start.strftime('%m/%Y'), meter_id))
+        return 0
+
+    values = MeterData.objects.filter(meter_id=meter_id, saved_time__gte=start, saved_time__lt=end)
+    if not values.filter(Q(delta_status=MeterData.DELTA_OK) | Q(delta_status__isnull=True)).exists():
+        # Already compacted
+        return 0
+    if values.filter(delta_status__isnull=True).exists():
+        recompute_deltas([meter_id], start)
+
+    readings = list(values.order_by('saved_time'))
+    if not readings:
+        return 0
+
+    write_archive(meter_id, start, readings, directory)
+
+    deleted = []
+    changes = dict()
+    for hour, group in groupby(readings, key=lambda reading: reading.saved_time.replace(minute=0, second=0)):
+        group = list(group)
+        if len(group) == 1 and group[0].delta_status == MeterData.DELTA_HOURLY:
+            continue
+
+        deleted.extend(reading.pk for reading in group[:-1])
+        changes[group[-1].pk] = compact_hour(group)
+
+    with transaction.atomic():
+        for i in range(0, len(deleted), BATCH_SIZE):
+            MeterData.objects.filter(pk__in=deleted[i:i + BATCH_SIZE]).delete()
+        pks = list(changes)
+        for i in range(0, len(pks), BATCH_SIZE):
+            save_deltas({pk: changes[pk] for pk in pks[i:i + BATCH_SIZE]})
+
+    return len(deleted)
+
+
+def compact_old_data(days=None, directory=None):
+    """Compacts all whole months which ended more than ``days`` days ago.
+
+    Args:
+        days (int): The age of the raw values to keep, defaults to RETENTION_DAYS.
+            0 keeps all raw values.
+
+    Returns:
+        The number of deleted values.
+    """
+    days = settings.RETENTION_DAYS if days is None else days
+    if not days:
+        return 0
+
+    end = month_range(datetime.today() - timedelta(days=days))[0]
+    # Raw values are OK or lack a delta, compacted ones are hourly or flagged.
+    ranges = MeterData.objects \
+        .filter(Q(delta_status=MeterData.DELTA_OK) | Q(delta_status__isnull=True), saved_time__lt=end) \
+        .values('meter_id') \
+        .annotate(first=Min('saved_time'), last=Max('saved_time')) \
+        .values_list('meter_id', 'first', 'last')
+
+    deleted = 0
+    for meter_id, first, last in ranges:
+        month = month_range(first)[0]
+        while month <= last:
+            deleted += compact_month(meter_id, month, directory)
+            month = month_range(month)[1]
+
+    logger.info('Compacted %d raw meter values older than %s' % (deleted, end))
+    return deleted
+
+
+def restore_month(meter_id, month, directory=None):
+    """Replaces the compacted values of a meter in a month with the archived raw values.
+    The month is kept from being compacted again until ``release_month`` is called.
+
+    Returns:
+        The number of restored values.
+    """
+    start, end = month_range(month)
+    readings = read_archive(meter_id, start, directory)
+    open(restored_path(meter_id, start, directory), 'w').close()
+    with transaction.atomic():
+        MeterData.objects.filter(meter_id=meter_id, saved_time__gte=start, saved_time__lt=end).delete()
+        set_slots(readings)
+        MeterData.objects.bulk_create(readings, batch_size=BATCH_SIZE)
+
+    return len(readings)
+
+
+def release_month(meter_id, month, directory=None):
+    """Allows a restored month of a meter to be compacted again.
+
+    Returns:
+        True if the month had been restored.
+    """
+    try:
+        os.remove(restored_path(meter_id, month_range(month)[0], directory))
+    except FileNotFoundError:
+        return False
+
+    return True
@@ -0,0 +1,151 @@
+"""
+Hourly, daily and monthly rollups of the meter values.
+
+The rollups hold the last value of each meter, and the sum of these values
+per mode, within every period. They are updated with each batch of readings
+written to MeterData, so that summaries over long timespans read a few
+rows per period instead of every quarter-hour value.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import DateTimeField, F, Value
+from django.db.models.functions import Greatest
+from mmetering.models import Meter, MeterData, MeterDataRollup, ModeRollup
+
+RESOLUTIONS = (MeterDataRollup.HOUR, MeterDataRollup.DAY, MeterDataRollup.MONTH)
+# The coarsest resolution is used for timespans longer than the given duration.
+MAX_TIMESPANS = (
+    (MeterDataRollup.MONTH, timedelta(days=400)),
+    (MeterDataRollup.DAY, timedelta(days=14)),
+    (MeterDataRollup.HOUR, timedelta(days=2)),
+)
+
+
+def period_start(saved_time, resolution):
+    """Returns the start of the hour, day or month containing ``saved_time``."""
+    start = saved_time.replace(minute=0, second=0, microsecond=0)
+    if resolution in (MeterDataRollup.DAY, MeterDataRollup.MONTH):
+        start = start.replace(hour=0)
+    if resolution == MeterDataRollup.MONTH:
+        start = start.replace(day=1)
+
+    return start
+
+
+def get_resolution(start, end):
+    """Returns the coarsest rollup resolution for a timespan, or None if
+    the quarter-hour values should be used."""
+    for resolution, timespan in MAX_TIMESPANS:
+        if end - start > timespan:
+            return resolution
+
+    return None
+
+
+def update_rollups(readings):
+    """Merges new MeterData objects into the rollups of all resolutions.
+
+    A reading replaces the rollup value of its meter if it is the latest one
+    within its period. The rollups of each mode are adjusted by the difference.
+    Has to be called within the transaction saving the readings.
+    """
+    if not readings:
+        return
+
+    modes = dict(Meter.objects.filter(pk__in={reading.meter_id for reading in readings})
+                 .values_list('pk', 'flat__modus'))
+
+    with transaction.atomic():
+        for resolution in RESOLUTIONS:
+            latest = dict()
+            for reading in readings:
+                key = (reading.meter_id, period_start(reading.saved_time, resolution))
+                if key not in latest or reading.saved_time > latest[key].saved_time:
+                    latest[key] = reading
+
+            existing = MeterDataRollup.objects.filter(
+                resolution=resolution,
+                meter_id__in={meter_id for meter_id, period in latest},
+                period__in={period for meter_id, period in latest}
+            )
+            rows = {(row.meter_id, row.period): row for row in existing}
+
+            changed = []
+            stale = []
+            deltas = defaultdict(float)
+            saved_times = dict()
+            for (meter_id, period), reading in latest.items():
+                row = rows.get((meter_id, period))
+                if row is not None and row.saved_time >= reading.saved_time:
+                    continue
+
+                if row is not None:
+                    stale.append(row.pk)
+                mode_key = (modes[meter_id], period)
+                deltas[mode_key] += reading.value - (row.value if row is not None else 0.0)
+                saved_times[mode_key] = max(saved_times.get(mode_key, reading.saved_time), reading.saved_time)
+                changed.append(MeterDataRollup(meter_id=meter_id, resolution=resolution, period=period,
+                                               saved_time=reading.saved_time, value=reading.value))
+
+            # Replace instead of updating row by row.
+            if stale:
+                MeterDataRollup.objects.filter(pk__in=stale).delete()
+            MeterDataRollup.objects.bulk_create(changed)
+
+            for (modus, period), delta in deltas.items():
+                saved_time = saved_times[(modus, period)]
+                row, created = ModeRollup.objects.get_or_create(
+                    modus=modus, resolution=resolution, period=period,
+                    defaults={'saved_time': saved_time, 'value': delta}
+                )
+                if not created:
+                    # Adjust in the database, another writer may adjust the same row concurrently.
+                    ModeRollup.objects.filter(pk=row.pk).update(
+                        value=F('value') + delta,
+                        saved_time=Greatest('saved_time', Value(saved_time, output_field=DateTimeField()))
+                    )
+
+
+def backfill_rollups(since=None, days=1):
+    """Rebuilds the rollups from MeterData, ``days`` days at a time, in a single transaction.
+
+    Args:
+        since (datetime): Only rebuild the rollups from the month containing
+            this point in time on. Defaults to all data.
+        days (int): The timespan of MeterData loaded at once.
+
+    Returns:
+        The number of readings processed.
+    """
+    data = MeterData.objects.all()
+    if since is not None:
+        since = period_start(since, MeterDataRollup.MONTH)
+        data = data.filter(saved_time__gte=since)
+
+    first = data.order_by('saved_time').values_list('saved_time', flat=True).first()
+    last = data.order_by('-saved_time').values_list('saved_time', flat=True).first()
+    if first is None:
+        return 0
+
+    count = 0
+    # Summaries keep reading the old rollups until the rebuild is committed.
+    with transaction.atomic():
+        old_meter_rollups = MeterDataRollup.objects.all()
+        old_mode_rollups = ModeRollup.objects.all()
+        if since is not None:
+            old_meter_rollups = old_meter_rollups.filter(period__gte=since)
+            old_mode_rollups = old_mode_rollups.filter(period__gte=since)
+        old_meter_rollups.delete()
+        old_mode_rollups.delete()
+
+        start = period_start(first, MeterDataRollup.DAY)
+        while start <= last:
+            end = start + timedelta(days=days)
+            readings = list(data.filter(saved_time__gte=start, saved_time__lt=end)
+                            .only('meter_id', 'saved_time', 'value'))
+            update_rollups(readings)
+            count += len(readings)
+            start = end
+
+    return count
@@ -0,0 +1,58 @@
+"""
+Integer quarter-hour slots of the meter data.
+
+Every reading carries the number of the quarter-hour it was taken in, so
+that the readings of different meters taken in the same quarter-hour can be
+matched exactly, even if their timestamps drifted by a few seconds or minutes.
+"""
+from datetime import datetime, timedelta
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from mmetering.models import MeterData
+
+SLOT_SECONDS = 15 * 60
+EPOCH = datetime(1970, 1, 1)
+BATCH_SIZE = 500
+
+
+def to_slot(saved_time):
+    """Returns the number of the quarter-hour containing ``saved_time``, counted from 1970
+    in local time, so that the slots of consecutive quarter-hours are consecutive numbers."""
+    return int((saved_time - EPOCH).total_seconds()) // SLOT_SECONDS
+
+
+def from_slot(slot):
+    """Returns the start of a quarter-hour slot."""
+    return EPOCH + timedelta(seconds=int(slot) * SLOT_SECONDS)
+
+
+def set_slots(readings):
+    """Sets the slot of unsaved MeterData objects."""
+    for reading in readings:
+        reading.slot = to_slot(reading.saved_time)
+
+
+def backfill_slots():
+    """Sets the slot of all saved readings without one, for data saved before slots were kept.
+
+    Readings taken at the same time share a single CASE branch, so one UPDATE
+    covers the readings of all meters in up to ``BATCH_SIZE`` points in time.
+
+    Returns:
+        The number of updated readings.
+    """
+    updated = 0
+    while True:
+        saved_times = list(MeterData.objects
+                           .filter(slot__isnull=True)
+                           .order_by('saved_time')
+                           .values_list('saved_time', flat=True)
+                           .distinct()[:BATCH_SIZE])
+        if not saved_times:
+            return updated
+
+        with transaction.atomic():
+            updated += MeterData.objects.filter(slot__isnull=True, saved_time__in=saved_times).update(
+                slot=Case(*[When(saved_time=saved_time, then=Value(to_slot(saved_time))) for saved_time in saved_times],
+                          output_field=IntegerField())
+            )
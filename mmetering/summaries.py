@@ -1,8 +1,14 @@
 import logging
 from datetime import datetime, timedelta, date
-from django.db.models import Sum, Count
-from mmetering.models import Flat, Meter, MeterData, Activities
-from collections import defaultdict
+from django.db.models import Sum, Count, Avg, Max, Min, Case, When, IntegerField
+from django.db.models.functions import Greatest
+from mmetering.models import Flat, Meter, MeterData, ModeRollup, PowerData, PowerQualityData, Activities
+from mmetering.billing import allocate_production
+from mmetering.dates import month_range
+from mmetering.deltas import get_previous
+from mmetering.latest import get_latest_values
+from mmetering.rollups import get_resolution
+from mmetering.slots import to_slot
 from itertools import chain
 from functools import reduce
 
@@ -70,6 +76,8 @@ class Overview:
 
     def get_data_range(self, start, end, mode):
         """Queries the summed up meter values per quarter-hour in a timespan.
+        For longer timespans, the last values per hour, day or month are
+        taken from the coarsest rollup fitting the timespan instead.
 
         Args:
              start (datetime): The start of the timespan.
@@ -86,6 +94,13 @@ class Overview:
                 }, ...
                 ]
         """
+        resolution = get_resolution(start, end)
+        if resolution is not None:
+            return ModeRollup.objects \
+                .filter(modus=mode, resolution=resolution, saved_time__range=[start, end]) \
+                .values('saved_time') \
+                .annotate(value_sum=Sum('value') * 1000)
+
         data = MeterData.objects.all() \
             .filter(
             meter__flat__modus__exact=mode,
@@ -106,17 +121,9 @@ class Overview:
             A list of summed up values, each representing a meter.
 
        """
-        meters = [x.pk for x in Meter.objects.filter(flat__modus=mode)]
-        values_until = []
-        for meter in meters:
-            try:
-                values_until.append(
-                    MeterData.objects.filter(meter__pk=meter, saved_time__lt=until).order_by('-pk')[0].value
-                )
-            except IndexError:
-                logger.info('The requested meter has no values yet.')
-
-        return values_until
+        meters = list(Meter.objects.filter(flat__modus=mode).order_by('pk').values_list('pk', flat=True))
+        latest = get_latest_values(meters, until)
+        return [latest[meter] for meter in meters if meter in latest]
 
     def get_total_consumption(self, until):
         """Queries the total consumption of all meters.
@@ -185,6 +192,130 @@ class LoadProfileOverview(Overview):
         }
 
 
+class PowerOverview(Overview):
+    """Derives from Overview and offers a ```to_dict``` method in order
+    to pass the sampled instantaneous power to the frontend.
+    """
+    def get_power_range(self, start, end, mode):
+        """Queries the summed up mean power per minute in a timespan.
+
+        Args:
+             start (datetime): The start of the timespan.
+             end (datetime): The end of the timespan.
+             mode (str): The desired mode of the meters,
+                'IM' for Import and 'EX' for Export.
+
+        Returns:
+            A QuerySet of pairs of power_sum and saved_time::
+                [{
+                    'power_sum': Sum of the mean power of all meters of type ``mode`` in W,
+                    'saved_time': Start of the minute
+                }, ...
+                ]
+        """
+        return PowerData.objects \
+            .filter(meter__flat__modus__exact=mode, saved_time__range=[start, end]) \
+            .values('saved_time') \
+            .annotate(power_sum=Sum('power_mean')) \
+            .order_by('saved_time')
+
+    def to_dict(self):
+        return {
+            'consumption': self.get_power_range(self.timerange[0], self.timerange[1], 'IM'),
+            'supply': self.get_power_range(self.timerange[0], self.timerange[1], 'EX')
+        }
+
+
+class PowerQualityOverview(Overview):
+    """Derives from Overview and offers a ```to_dict``` method in order
+    to pass the power quality of all meters or a single one to the frontend.
+    """
+    QUANTITIES = ('voltage_l1', 'voltage_l2', 'voltage_l3', 'current_l1', 'current_l2', 'current_l3',
+                  'power_l1', 'power_l2', 'power_l3', 'thd_l1', 'thd_l2', 'thd_l3', 'frequency')
+
+    def get_quality_range(self, start, end, meter=None):
+        """Queries the power quality per quarter-hour in a timespan.
+
+        Args:
+             start (datetime): The start of the timespan.
+             end (datetime): The end of the timespan.
+             meter (int): The address of a single meter. If not given, the
+                voltages and the frequency are averaged and the maximum THD
+                is taken over all meters.
+
+        Returns:
+            A QuerySet of dicts with the saved_time and the quantities.
+        """
+        data = PowerQualityData.objects.filter(saved_time__range=[start, end])
+        if meter is not None:
+            return data.filter(meter__addresse=meter).values('saved_time', *self.QUANTITIES).order_by('saved_time')
+
+        return data \
+            .values('saved_time') \
+            .annotate(voltage_l1=Avg('voltage_l1'), voltage_l2=Avg('voltage_l2'), voltage_l3=Avg('voltage_l3'),
+                      thd_max=Max(Greatest('thd_l1', 'thd_l2', 'thd_l3')), frequency=Avg('frequency')) \
+            .order_by('saved_time')
+
+    def to_dict(self):
+        meter = self._filters.get('meter') if self._filters is not None else None
+        if meter:
+            try:
+                meter = int(meter)
+            except ValueError:
+                logger.warning('Expected the address of a meter. I got %s' % meter)
+                return {'quality': PowerQualityData.objects.none()}
+
+        return {
+            'quality': self.get_quality_range(self.timerange[0], self.timerange[1], meter or None)
+        }
+
+
+class TelemetryOverview(Overview):
+    """Derives from Overview and offers a ```to_dict``` method in order
+    to pass the polling telemetry of a timespan to the frontend.
+
+    The telemetry models belong to the backend, they are imported where they
+    are used so that mmetering does not depend on the backend at import time.
+    """
+    def get_meter_stats(self, start, end):
+        """Aggregates the telemetry of each meter, slowest meters first.
+
+        Returns:
+            A QuerySet of dicts with the address and flat of the meter, the
+            average and maximum latency in sec, the number of polls, attempts,
+            timeouts and failed polls and the bytes on the wire.
+        """
+        from backend.models import MeterPoll
+        return MeterPoll.objects \
+            .filter(cycle__query_time__range=[start, end]) \
+            .values('meter__addresse', 'meter__flat__name') \
+            .annotate(latency_avg=Avg('latency'), latency_max=Max('latency'), polls=Count('id'),
+                      attempts=Sum('attempts'), timeouts=Sum('timeouts'), bytes=Sum('bytes'),
+                      failed=Sum(Case(When(saved=False, then=1), default=0, output_field=IntegerField()))) \
+            .order_by('-latency_avg')
+
+    def get_bus_stats(self, start, end):
+        """Aggregates the telemetry of each bus, showing how close it came to the deadline."""
+        from backend.models import BusCycle
+        return BusCycle.objects \
+            .filter(cycle__query_time__range=[start, end]) \
+            .values('port') \
+            .annotate(duration_avg=Avg('duration'), duration_max=Max('duration'),
+                      busy_time_avg=Avg('busy_time'), deadline_margin_min=Min('deadline_margin')) \
+            .order_by('port')
+
+    def to_dict(self):
+        from backend.models import PollingCycle
+        return {
+            'cycles': PollingCycle.objects
+                .filter(query_time__range=[self.timerange[0], self.timerange[1]])
+                .values('query_time', 'duration', 'readings')
+                .order_by('query_time'),
+            'buses': self.get_bus_stats(self.timerange[0], self.timerange[1]),
+            'meters': self.get_meter_stats(self.timerange[0], self.timerange[1])
+        }
+
+
 class DataOverview(Overview):
     """Derives from Overview and offers a ```to_dict``` method in oder
     to pass data values to the frontend's Overview Panel.
@@ -229,18 +360,17 @@ class DownloadOverview(Overview):
             The requested month and two lists of dictionaries containing key-value pairs as initialized
             in the first for-loop and expanded by get_extended_meter_data.
         """
-        flats = [x.pk for x in Flat.objects.all().order_by('name')]
         import_values = []
         export_values = []
         consumption = {}
         production = {}
 
-        for flat in flats:
-            flat_object = Flat.objects.get(pk=flat)
+        for flat_object in Flat.objects.all().order_by('name'):
+            flat = flat_object.pk
             meter_data_object = MeterData.objects.filter(
                     meter__flat__pk=flat,
-                    saved_time__year=self.end[0].year,
-                    saved_time__month=self.end[0].month
+                    saved_time__gte=month_range(self.end[0])[0],
+                    saved_time__lt=month_range(self.end[0])[1]
             ).order_by('-pk')
 
             value = {
@@ -263,7 +393,6 @@ class DownloadOverview(Overview):
                 }
             else:
                 current_month_exists = False
-                flat_object = Flat.objects.get(pk=flat)
                 value['ID'] = flat
                 value['Bezug'] = flat_object.name
 
@@ -276,158 +405,85 @@ class DownloadOverview(Overview):
                     production[flat] = DownloadOverview.get_consumption(flat, self.end[0])
                 export_values.append(value)
 
-        # Calculate the total consumption for each timeslot
-        total_consumption = defaultdict(float)
-        for flat in consumption:
-            for timeslot in consumption[flat]:
-                total_consumption[timeslot] += consumption[flat][timeslot]
+        # Split the production among the consumers for all timeslots at once
+        production_parts = allocate_production(consumption, production)
+        producer_names = dict(Flat.objects.filter(pk__in=production.keys()).values_list('pk', 'name'))
+        last_month_values = self.get_last_month_values(consumption.keys())
 
         # Extend import data
-        for i in range(0, len(import_values)):
-            pk = import_values[i]['ID']
-            meter_value = import_values[i]['Zaehlerstand']
-            # TODO: fix program control through exception handling
-            try:
-                import_values[i].update(self.get_extended_meter_data(pk, total_consumption, production, consumption[pk], meter_value))
-            except KeyError:
+        for value in import_values:
+            pk = value['ID']
+            if pk not in production_parts:
                 logger.warning('No data available.')
+                continue
 
-        return self.end[0].strftime('%b'), import_values, export_values
-
-    @staticmethod
-    def get_next_value(meter_pk, saved_time, delta=timedelta(minutes=15)):
-        """Queries the temporal successor of a meter data point.
-
-        Args:
-            meter_pk: The meters private key.
-            saved_time: The wanted time as a datetime object.
-            delta: A timedelta object defining what a successor is.
-
-        Returns:
-            The temporal successor as a MeterData object.
-        """
-        next_value = MeterData.objects.filter(
-            meter__flat__pk=meter_pk,
-            saved_time=saved_time + delta
-        ).values('saved_time', 'value')
+            value.update(self.get_extended_meter_data(pk, value['Zaehlerstand'], production_parts[pk],
+                                                      producer_names, last_month_values.get(pk)))
 
-        if len(next_value) > 0:
-            return next_value[0]
+        return self.end[0].strftime('%b'), import_values, export_values
 
     @staticmethod
     def get_consumption(meter_pk, timerange):
         """Calculates the consumption based on meter values for a given meter.
+        Uses the deltas stored at ingest if they are available for the whole month.
 
         Args:
             meter_pk: The meters private key.
             timerange: A datetime object where month and year will be extracted.
 
         Returns:
-             A dictionary with datetime objects as keys and consumption values as values.
+             A dictionary with quarter-hour slots (see mmetering.slots) as keys and consumption values as values.
         """
-        time_series = MeterData.objects \
-            .filter(meter__flat__pk=meter_pk, saved_time__year=timerange.year, saved_time__month=timerange.month) \
-            .values('saved_time', 'value')
-        time_series = list(time_series)
-        if len(time_series) > 0:
-            # Add the first element of the next month in order to get the consumption
-            last_item = time_series[len(time_series) - 1]
-            time_series.append(DownloadOverview.get_next_value(meter_pk, last_item['saved_time']))
-
-            consumption_series = dict()
-
-            for i in range(0, len(time_series) - 1):
-                value = time_series[i]
-                delta_value = time_series[i+1]
-                if value is not None and delta_value is not None:
-                    consumption_series[delta_value['saved_time']] = delta_value['value'] - value['value']
-
-            # Remove the last element
-            time_series.pop()
-            return consumption_series
-
-    @staticmethod
-    def get_value_at(dictionary, key: datetime, threshold=3):
-        """Timestamps of meter values can sometimes vary between a few minutes so that comparing
-        datetime objects might not always come to the same result. In order to solve that one can either
-        set a fixed datetime for all meter values queried at the same time slot (quarter-hour) or check
-        multiple keys. This method does the latter.
-
-        Args:
-            dictionary: The dictionary where we want values from.
-            key: The key to look for.
-            threshold: A limited region.
+        start, end = month_range(timerange)
+        deltas = list(MeterData.objects
+                      .filter(meter__flat__pk=meter_pk, saved_time__gt=start, saved_time__lte=end)
+                      .values_list('saved_time', 'slot', 'delta', 'delta_status'))
+        if deltas and all(status is not None for saved_time, slot, delta, status in deltas):
+            return {to_slot(saved_time) if slot is None else slot: delta
+                    for saved_time, slot, delta, status in deltas if delta is not None}
+
+        # Fall back to the counter values where the deltas have not been computed yet.
+        consumption = list(MeterData.objects
+                           .filter(meter__flat__pk=meter_pk, saved_time__gte=start, saved_time__lte=end)
+                           .consumption())
+        if consumption:
+            return {to_slot(saved_time): value for meter_id, saved_time, value in consumption if value is not None}
+
+    def get_last_month_values(self, flat_pks):
+        """Queries the last meter value of the month before the requested one for each flat.
 
         Returns:
-            The value ´near´ (according to the :param threshold) the :param key.
+            A dictionary containing a tuple (saved_time, value) for each flat with values in that month.
         """
-        # TODO: Check deprecation since datetime is set on the first query of meter data now.
-        times = 0
-        element = None
-        while element is None and times < threshold:
-            element = dictionary.get(key)
-            key = key.replace(minute=key.minute + 1)
-            times += 1
+        start, end = month_range(month_range(self.end[0])[0] - timedelta(days=1))
+        meters = dict(Meter.objects.filter(flat__pk__in=flat_pks).values_list('pk', 'flat_id'))
+        return {meters[meter_id]: previous for meter_id, previous in get_previous(meters.keys(), end).items()
+                if previous[0] >= start}
 
-        return element
-
-    def get_extended_meter_data(self, pk, total_consumption, production_values, consumption_values, meter_value):
+    def get_extended_meter_data(self, pk, meter_value, production_parts, producer_names, last_month):
         """Gathers further information for a given flat not contained in a
         regular MeterData object.
 
         Args:
             pk: The private key of the desired flat.
-            total_consumption: A dictionary containing the total consumption of all meters like {datetime: float}.
-            production_values: A dictionary containing the production values for each
-            export flat like {pk: {datetime: float}}.
-            consumption_values: A dictionary containing the consumption values of the flat with
-            private key :param pk like {datetime: float}.
             meter_value: The meter value of the flat with private key :param pk.
+            production_parts: A dictionary containing the share of each export flat in
+            the consumption of the flat like {pk: float}, see mmetering.billing.
+            producer_names: A dictionary containing the name of each export flat like {pk: str}.
+            last_month: A tuple (saved_time, value) of the last meter value of the previous month, or None.
 
         Returns:
             A dictionary with human-readable keys and corresponding values.
         """
-        last_month = self.end[0].replace(day=1) - timedelta(days=1)
-        last_month_values = MeterData.objects.filter(
-            meter__flat__pk=pk,
-            saved_time__month=last_month.month,
-            saved_time__year=last_month.year).order_by('-saved_time')
-
-        if last_month_values.exists():
-            last_month_value = last_month_values.first().value
-            last_month_saved_time = last_month_values.first().saved_time
+        if last_month is not None:
+            last_month_saved_time, last_month_value = last_month
         else:
             last_month_value = 0
             last_month_saved_time = DownloadOverview.NO_DATA
 
-        production_parts = dict.fromkeys(production_values, 0.0)
         consumption = meter_value - last_month_value
         logger.info("Consumption: %f" % consumption)
 
-        for el in consumption_values:
-            saved_time = el
-            value = consumption_values[el]
-            specific_total_consumption = self.get_value_at(total_consumption, saved_time)
-            specific_total_production = 0.0
-
-            for meter_id in production_values.keys():
-                val = self.get_value_at(production_values[meter_id], saved_time)
-                if val is not None:
-                    specific_total_production += val
-
-            if specific_total_consumption is not None:
-                coeff = value / specific_total_consumption
-                for meter_id in production_values.keys():
-                    production_value = self.get_value_at(production_values.get(meter_id), saved_time)
-
-                    if production_value is not None:
-                        if specific_total_production > specific_total_consumption:
-                            # if all export meters produce more than all others consume
-                            # then ignore the surplus.
-                            production_value = (production_value/specific_total_production) * specific_total_consumption
-
-                        production_parts[meter_id] += coeff * production_value
-
         part_distributor = consumption
         for val in production_parts.values():
             part_distributor -= val
@@ -435,7 +491,6 @@ class DownloadOverview(Overview):
         result = {'Vormonat': last_month_value, 'Uhrzeit Vormonat': last_month_saved_time,
                   'Verbrauch': consumption, 'Anteil Versorger': part_distributor}
         for key in production_parts.keys():
-            name = Flat.objects.get(pk=key).name
-            result[name] = production_parts[key]
+            result[producer_names[key]] = production_parts[key]
 
         return result
@@ -1,9 +1,22 @@
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.core import mail
-from mmetering.summaries import Overview
+import csv
+import os
+import tempfile
+from django.db.models import Sum
+from mmetering.billing import allocate_production
+from mmetering.columnar import ColumnarArchive
+from mmetering.deltas import recompute_deltas
+from mmetering.imports import import_readings
+from mmetering.latest import get_latest_values, rebuild_latest, update_latest
+from mmetering.retention import compact_old_data, release_month, restore_month
+from mmetering.models import LatestMeterData, Meter, MeterData, MeterDataRollup, ModeRollup
+from mmetering.rollups import backfill_rollups
+from mmetering.slots import backfill_slots, from_slot, to_slot
+from mmetering.summaries import DownloadOverview, Overview, PowerQualityOverview
 from mmetering.tasks import send_contact_email_task, send_system_email_task
-from datetime import datetime
+from datetime import datetime, timedelta
 from freezegun import freeze_time
 
 
@@ -48,6 +61,9 @@ class SummariesDataTest(TestCase):
         self.assertListEqual(SummariesDataTest.data.get_total(end_date_import, 'IM'), asserted_values_import)
         self.assertListEqual(SummariesDataTest.data.get_total(end_date_export, 'EX'), asserted_values_export)
 
+    def test_power_quality_invalid_meter(self):
+        self.assertListEqual(list(PowerQualityOverview({'meter': 'abc'}).to_dict()['quality']), [])
+
     def test_get_total_consumption(self):
         end_date = datetime(2017, 2, 7, 0, 0, 0)
 
@@ -74,6 +90,193 @@ class SummariesDataTest(TestCase):
             self.assertFalse(data.is_supply_over_threshold(0.7))
 
 
+class RollupTest(TestCase):
+    fixtures = ['mmetering/fixtures/mmetering_models_testdata.json']
+
+    def test_backfill_rollups(self):
+        self.assertEqual(backfill_rollups(), MeterData.objects.count())
+
+        hour = datetime(2017, 2, 4, 8, 0)
+        latest = dict()
+        for data in MeterData.objects.filter(meter__flat__modus='IM', saved_time__gte=hour,
+                                             saved_time__lt=hour.replace(hour=9)).order_by('saved_time'):
+            latest[data.meter_id] = data.value
+
+        rollup = ModeRollup.objects.get(modus='IM', resolution=MeterDataRollup.HOUR, period=hour)
+        self.assertAlmostEqual(rollup.value, sum(latest.values()), 3)
+
+        # Rebuilding must not change the result.
+        backfill_rollups(hour)
+        rebuilt = ModeRollup.objects.get(modus='IM', resolution=MeterDataRollup.HOUR, period=hour)
+        self.assertAlmostEqual(rebuilt.value, rollup.value, 3)
+
+    def test_get_data_range_uses_rollups(self):
+        backfill_rollups()
+        data = Overview(DummyRequest.GET)
+        months = data.get_data_range(datetime(2016, 1, 1), datetime(2017, 12, 31), 'IM')
+
+        self.assertEqual(len(months), ModeRollup.objects.filter(modus='IM', resolution=MeterDataRollup.MONTH).count())
+
+
+class DeltaTest(TestCase):
+    fixtures = ['mmetering/fixtures/mmetering_models_testdata.json']
+
+    def test_recompute_deltas(self):
+        meters = Meter.objects.values_list('pk', flat=True)
+        month = datetime(2017, 2, 1)
+        expected = {meter.flat_id: DownloadOverview.get_consumption(meter.flat_id, month)
+                    for meter in Meter.objects.all()}
+
+        self.assertEqual(recompute_deltas(meters), MeterData.objects.count())
+        self.assertEqual(recompute_deltas(meters), 0)
+        self.assertFalse(MeterData.objects.filter(delta_status__isnull=True).exists())
+        self.assertEqual(MeterData.objects.filter(delta_status=MeterData.DELTA_FIRST).count(), len(meters))
+
+        for flat, consumption in expected.items():
+            deltas = DownloadOverview.get_consumption(flat, month)
+            for saved_time, value in (consumption or dict()).items():
+                self.assertAlmostEqual(deltas[saved_time], value, 3)
+
+    def test_consumption_query(self):
+        recompute_deltas(Meter.objects.values_list('pk', flat=True))
+        deltas = {(meter_id, saved_time): delta for meter_id, saved_time, delta in MeterData.objects
+                  .filter(delta_status=MeterData.DELTA_OK).values_list('meter_id', 'saved_time', 'delta')}
+        consumption = list(MeterData.objects.all().consumption())
+
+        self.assertEqual(len(consumption), MeterData.objects.count())
+        for meter_id, saved_time, value in consumption:
+            if (meter_id, saved_time) in deltas:
+                self.assertAlmostEqual(deltas[meter_id, saved_time], value, 3)
+
+
+class LatestMeterDataTest(TestCase):
+    fixtures = ['mmetering/fixtures/mmetering_models_testdata.json']
+
+    def test_latest_values(self):
+        meters = list(Meter.objects.values_list('pk', flat=True))
+        until = datetime(2017, 2, 5, 12, 0)
+        expected = {meter: MeterData.objects.filter(meter_id=meter, saved_time__lt=until)
+                    .order_by('-saved_time').first().value for meter in meters}
+
+        self.assertEqual(rebuild_latest(), len(meters))
+        self.assertEqual(get_latest_values(meters, until), expected)
+        with self.assertNumQueries(1):
+            get_latest_values(meters, datetime(2018, 1, 1))
+
+        reading = MeterData.objects.create(meter_id=meters[0], saved_time=datetime(2017, 3, 1), value=10000.0)
+        update_latest([reading])
+        self.assertEqual(LatestMeterData.objects.get(meter_id=meters[0]).value, 10000.0)
+        self.assertEqual(get_latest_values(meters)[meters[0]], 10000.0)
+
+
+class ImportTest(TestCase):
+    fixtures = ['mmetering/fixtures/mmetering_models_testdata.json']
+
+    def test_import_readings(self):
+        meter = Meter.objects.first()
+        readings = list(MeterData.objects.filter(meter=meter).order_by('saved_time'))
+        MeterData.objects.filter(meter=meter, saved_time__gte=readings[100].saved_time).delete()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'readings.csv')
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['meter', 'saved_time', 'value'])
+                for reading in readings:
+                    # Drifted timestamps are rounded to the quarter-hour.
+                    writer.writerow([meter.seriennummer, (reading.saved_time + timedelta(minutes=2)).isoformat(),
+                                     reading.value])
+                writer.writerow(['unknown', readings[0].saved_time.isoformat(), 1.0])
+
+            stats = import_readings([path])
+            self.assertEqual((stats['imported'], stats['skipped'], stats['invalid']),
+                             (len(readings) - 100, 100, 1))
+            self.assertEqual(import_readings([path])['imported'], 0)
+
+        self.assertListEqual(list(MeterData.objects.filter(meter=meter).order_by('saved_time')
+                                  .values_list('saved_time', 'value')),
+                             [(reading.saved_time, reading.value) for reading in readings])
+        self.assertFalse(MeterData.objects.filter(meter=meter, delta_status__isnull=True).exists())
+        self.assertEqual(LatestMeterData.objects.get(meter=meter).saved_time, readings[-1].saved_time)
+        days = {reading.saved_time.date(): reading.value for reading in readings[100:]}
+        self.assertDictEqual({rollup.period.date(): rollup.value for rollup in MeterDataRollup.objects
+                              .filter(meter=meter, resolution=MeterDataRollup.DAY)}, days)
+
+
+class RetentionTest(TestCase):
+    fixtures = ['mmetering/fixtures/mmetering_models_testdata.json']
+
+    def test_compact_and_restore(self):
+        recompute_deltas(Meter.objects.values_list('pk', flat=True))
+        count = MeterData.objects.count()
+        consumption = MeterData.objects.aggregate(total=Sum('delta'))['total']
+
+        with tempfile.TemporaryDirectory() as directory:
+            deleted = compact_old_data(days=1, directory=directory)
+            self.assertGreater(deleted, 0)
+            self.assertEqual(MeterData.objects.count(), count - deleted)
+            self.assertAlmostEqual(MeterData.objects.aggregate(total=Sum('delta'))['total'], consumption, 3)
+            self.assertEqual(compact_old_data(days=1, directory=directory), 0)
+
+            meter = MeterData.objects.first().meter_id
+            restore_month(meter, datetime(2017, 2, 1), directory)
+            self.assertEqual(MeterData.objects.filter(meter_id=meter).count(),
+                             len(set(MeterData.objects.filter(meter_id=meter).values_list('saved_time', flat=True))))
+            # A restored month is kept until it is released.
+            self.assertEqual(compact_old_data(days=1, directory=directory), 0)
+            self.assertTrue(release_month(meter, datetime(2017, 2, 15), directory))
+            self.assertGreater(compact_old_data(days=1, directory=directory), 0)
+
+
+class BillingTest(TestCase):
+    def test_allocate_production(self):
+        consumption = {1: {0: 1.0, 1: 3.0, 2: 0.0}, 2: {0: 3.0, 1: 1.0}, 3: None}
+        production = {9: {0: 2.0, 1: 8.0, 2: 5.0}, 11: {}}
+
+        shares = allocate_production(consumption, production)
+        # The surplus in slot 1 and the production without consumption in slot 2 are not allocated.
+        self.assertAlmostEqual(shares[1][9], 0.5 + 3.0)
+        self.assertAlmostEqual(shares[2][9], 1.5 + 1.0)
+        self.assertEqual(shares[3], {9: 0.0, 11: 0.0})
+        self.assertEqual(shares[1][11], 0.0)
+
+
+class SlotTest(TestCase):
+    fixtures = ['mmetering/fixtures/mmetering_models_testdata.json']
+
+    def test_to_slot(self):
+        slot = to_slot(datetime(2017, 2, 4, 8, 0))
+        self.assertEqual(to_slot(datetime(2017, 2, 4, 8, 14, 59)), slot)
+        self.assertEqual(to_slot(datetime(2017, 2, 4, 8, 59)), slot + 3)
+        self.assertEqual(from_slot(slot + 4), datetime(2017, 2, 4, 9, 0))
+
+    def test_backfill_slots(self):
+        self.assertEqual(backfill_slots(), MeterData.objects.count())
+        self.assertEqual(backfill_slots(), 0)
+        for saved_time, slot in MeterData.objects.values_list('saved_time', 'slot'):
+            self.assertEqual(slot, to_slot(saved_time))
+
+
+class ColumnarArchiveTest(TestCase):
+    fixtures = ['mmetering/fixtures/mmetering_models_testdata.json']
+
+    def test_append_and_read(self):
+        meter = MeterData.objects.first().meter_id
+        start = datetime(2017, 2, 4, 8, 0)
+        end = datetime(2017, 2, 4, 9, 0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            archive = ColumnarArchive(directory)
+            self.assertEqual(archive.append(meter), MeterData.objects.filter(meter_id=meter).count())
+            self.assertEqual(archive.append(meter), 0)
+
+            columns = archive.read(meter, start, end)
+            expected = MeterData.objects.filter(meter_id=meter, saved_time__gte=start, saved_time__lt=end) \
+                .order_by('saved_time').values_list('saved_time', 'value')
+            self.assertListEqual([(from_slot(slot), value) for slot, value in zip(columns['slot'], columns['value'])],
+                                 list(expected))
+
+
 @override_settings(CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
                    CELERY_ALWAYS_EAGER=True,
                    BROKER_BACKEND='memory')
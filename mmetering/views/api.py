@@ -2,7 +2,8 @@ from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from mmetering.summaries import LoadProfileOverview, DataOverview
+from mmetering.summaries import LoadProfileOverview, DataOverview, PowerOverview, PowerQualityOverview, \
+    TelemetryOverview
 
 
 class APILoadProfileView(APIView):
@@ -20,3 +21,30 @@ class APIDataOverviewView(APIView):
     def get(self, request, format=None):
         overview = DataOverview(request.GET)
         return Response(overview.to_dict())
+
+
+class APIPowerView(APIView):
+    """Powers near-live load widgets with the sampled power per minute."""
+    parser_classes = (JSONParser,)
+
+    def get(self, request, format=None):
+        power = PowerOverview(request.GET)
+        return Response(power.to_dict())
+
+
+class APIPowerQualityView(APIView):
+    """Returns the power quality per quarter-hour, of a single meter if ``meter`` is given."""
+    parser_classes = (JSONParser,)
+
+    def get(self, request, format=None):
+        quality = PowerQualityOverview(request.GET)
+        return Response(quality.to_dict())
+
+
+class APITelemetryView(APIView):
+    """Returns the polling telemetry of cycles, buses and meters."""
+    parser_classes = (JSONParser,)
+
+    def get(self, request, format=None):
+        telemetry = TelemetryOverview(request.GET)
+        return Response(telemetry.to_dict())
@@ -96,3 +96,21 @@ CELERYBEAT_MAX_LOOP_INTERVAL = 900
 CELERY_SEND_TASK_ERROR_EMAILS = True
 
 MODBUS_PORT = config.get('client', 'modbus-port')
+# Set to true if meters are polled by the run_acquisition service
+# instead of the save_meter_data_task.
+ACQUISITION_DAEMON = config.getboolean('client', 'acquisition-daemon', fallback=False)
+# 'serial' polls every bus in its own thread, 'asyncio' polls all buses from
+# one event loop and requires pyserial-asyncio.
+ACQUISITION_ENGINE = config.get('client', 'acquisition-engine', fallback='serial')
+# Set to true in order to read voltage, current, power, THD and frequency
+# of every meter along with the energy values.
+ACQUISITION_POWER_QUALITY = config.getboolean('client', 'acquisition-power-quality', fallback=False)
+# Readings are journaled in this file until they are in the database.
+ACQUISITION_JOURNAL = config.get('client', 'acquisition-journal',
+                                 fallback=os.path.join(BASE_DIR, 'journal', 'readings.journal'))
+# Raw meter values older than this are compacted to hourly values and archived,
+# 0 keeps all raw values.
+RETENTION_DAYS = config.getint('client', 'retention-days', fallback=0)
+RETENTION_ARCHIVE = config.get('client', 'retention-archive', fallback=os.path.join(BASE_DIR, 'archive'))
+# Columnar copy of the meter data for analysis, see mmetering.columnar.
+COLUMNAR_ARCHIVE = config.get('client', 'columnar-archive', fallback=os.path.join(BASE_DIR, 'columnar'))
@@ -33,4 +33,7 @@ urlpatterns = [
     url(r'^api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     url(r'^api/loadprofile/$', views.APILoadProfileView.as_view()),
     url(r'^api/overview/$', views.APIDataOverviewView.as_view()),
+    url(r'^api/telemetry/$', views.APITelemetryView.as_view()),
+    url(r'^api/power/$', views.APIPowerView.as_view()),
+    url(r'^api/powerquality/$', views.APIPowerQualityView.as_view()),
 ]